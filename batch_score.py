@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""batch_score.py
+
+Score many stocks in one run and write a ranked results table.
+
+Usage: python3 batch_score.py [SYMBOL ...] [--batch-size N] [--output rankings.csv] [--walk-forward]
+Without symbols every model saved under models/ is scored. --walk-forward also scores every fold and
+adds the spread of the fold scores (lower is steadier) to the table.
+
+"""
+
+import os  # For interacting with the operating system
+import csv  # For writing the results table
+import glob  # For listing the saved models
+import time  # For measuring throughput
+import argparse  # For the command line interface
+
+from model import Model  # The Model class for stock prediction
+from model_registry import registry  # Process-wide cache of loaded models
+from score_cache import score_cache  # Persistent cache of computed scores
+from numpy_lstm import NumpyLSTM, predict_many  # Stacked TensorFlow-free inference
+from folds import fold_stability  # Summary of walk-forward fold scores
+from scoring import score_batch  # Vectorized score and metrics
+from rankings import RANKINGS_PATH  # Default location of the ranked results table
+from model_store import model_store  # Packed store of every model's weights
+
+BATCH_SIZE = 16  # Number of symbols prepared and predicted together
+METRIC_COLUMNS = ["mape", "directional_accuracy", "drawdown", "stability"]  # Extra columns of the table
+
+
+# Symbols that have a saved model (packed or as a .keras file), in alphabetical order
+def catalogue_symbols(models_dir: str = "models"):
+    keras_symbols = {os.path.splitext(os.path.basename(path))[0] for path in glob.glob(os.path.join(models_dir, "*.keras"))}
+    return sorted(keras_symbols.union(model_store.symbols()))
+
+
+# Run prediction for a group of prepared symbols. NumPy models (packed or exported) with the same architecture
+# are stacked and run in one vectorized pass; Keras models get one predict_on_batch call each
+# (each symbol has its own weights, so their windows cannot share a Keras call)
+def predict_group(prepared):
+    predictions = [None] * len(prepared)
+    stacks = {}  # architecture -> indexes of the prepared symbols
+    models = []
+    for n, (model, _, X_test, _) in enumerate(prepared):
+        lstm = registry.get(model.inference_path())
+        models.append(lstm)
+        if isinstance(lstm, NumpyLSTM):
+            key = (tuple(w.shape for w in lstm.get_weights()), lstm.activation, lstm.recurrent_activation,
+                   lstm.dense_activation, X_test.shape[1:])
+            stacks.setdefault(key, []).append(n)
+        else:
+            predictions[n] = lstm.predict_on_batch(X_test)
+    for indexes in stacks.values():
+        outputs = predict_many([models[n] for n in indexes], [prepared[n][2] for n in indexes])
+        for n, output in zip(indexes, outputs):
+            predictions[n] = output
+    return predictions
+
+
+# Score every symbol in `symbols` and return the results ranked by score (best first)
+def score_many(symbols, batch_size: int = BATCH_SIZE, output: str = RANKINGS_PATH, walk_forward: bool = False):
+    started = time.perf_counter()
+    results, skipped = [], []
+
+    for first in range(0, len(symbols), batch_size):
+        prepared = []
+        for symbol in symbols[first:first + batch_size]:
+            model = Model(symbol)
+            if not model.has_model():
+                skipped.append((symbol, "no model"))  # Training is left to the request path
+                continue
+            try:
+                model.fetch_data()
+            except ValueError:
+                skipped.append((symbol, "not found"))
+                continue
+            except Exception as error:  # Provider down and nothing stored, the rest of the run goes on
+                skipped.append((symbol, f"fetch failed: {error}"))
+                continue
+            fingerprint = model.fingerprint()
+            cached = None if walk_forward else score_cache.get(symbol, fingerprint)
+            if cached is not None:
+                score_cache.touch(symbol)
+                results.append({"symbol": symbol, "score": cached, "last_bar": fingerprint["last_bar"]})
+                continue
+            X_train, X_test, y_train, y_test = model.prepare(walk_forward)
+            prepared.append((model, y_train, X_test, y_test))
+
+        if not prepared:
+            continue
+        predictions = predict_group(prepared)
+        # Every symbol of the group is scored in one array operation, over the tail of its predictions
+        metrics = score_batch(predictions, [y_test for _, _, _, y_test in prepared],
+                              [y_train for _, y_train, _, _ in prepared],
+                              window=Model.score_params["window"], downtrend_penalty=Model.score_params["downtrend_penalty"])
+        for n, ((model, _, _, _), y_pred) in enumerate(zip(prepared, predictions)):
+            fingerprint = model.fingerprint()
+            result = {"symbol": model.stock, "last_bar": fingerprint["last_bar"]}
+            result.update({name: float(values[n]) for name, values in metrics.items()})
+            if walk_forward:
+                result["stability"] = fold_stability(model.fold_scores(y_pred))["std"]
+            score_cache.put(model.stock, result["score"], fingerprint)
+            results.append(result)
+
+    elapsed = time.perf_counter() - started
+    results.sort(key=lambda result: result["score"], reverse=True)
+    if output:
+        write_rankings(results, output)
+
+    for symbol, reason in skipped:
+        print(f"Skipped {symbol}: {reason}")
+    print(f"Scored {len(results)} symbols in {elapsed:.1f}s ({len(results) / elapsed if elapsed else 0:.2f} symbols/s)")
+    return results
+
+
+# Write the ranked results table as CSV
+def write_rankings(results, path: str = RANKINGS_PATH) -> None:
+    scored_at = time.strftime("%Y-%m-%dT%H:%M:%S")
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["rank", "symbol", "score"] + METRIC_COLUMNS + ["last_bar", "scored_at"])
+        for rank, result in enumerate(results, start=1):
+            # Cached scores come without the other metrics
+            metrics = [f"{result[name]:.4f}" if result.get(name) is not None else "" for name in METRIC_COLUMNS]
+            writer.writerow([rank, result["symbol"], f"{result['score']:.2f}"] + metrics + [result["last_bar"], scored_at])
+    os.replace(tmp_path, path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Score many stocks and write a ranked table.")
+    parser.add_argument("symbols", nargs="*", help="symbols to score (default: every saved model)")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="symbols prepared and predicted together")
+    parser.add_argument("--output", default=RANKINGS_PATH, help="where to write the ranked table")
+    parser.add_argument("--walk-forward", action="store_true", help="score every fold and report the spread")
+    args = parser.parse_args()
+
+    symbols = [symbol.upper() for symbol in args.symbols] or catalogue_symbols()
+    for rank, result in enumerate(score_many(symbols, args.batch_size, args.output, args.walk_forward), start=1):
+        stability = f"  ±{result['stability']:.2f}" if result.get("stability") is not None else ""
+        print(f"{rank:>3}. {result['symbol']:<6} {result['score']:6.2f}{stability}")
@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""benchmark.py
+
+Time every stage of a "start" press (fetch, preprocess, train, load, predict, score, display) and the
+end-to-end path on synthetic data, with a stub price provider and a simulated LCD bus, and print the
+results as JSON. Runs in a scratch directory, so the real prices, models and scores are not touched.
+
+Usage: python3 benchmark.py [--bars N] [--symbols N] [--repeat N] [--epochs N] [--no-train] [--output FILE]
+
+Peak memory is measured with tracemalloc (Python and NumPy allocations; TensorFlow's native memory is
+only visible in the process-wide max_rss).
+
+"""
+
+import os  # For interacting with the operating system
+import sys  # For the Python version
+import json  # For the report
+import time  # For the stage timings
+import shutil  # For removing the scratch directory
+import hashlib  # For per-symbol seeds
+import importlib  # For timing the TensorFlow import on its own
+import argparse  # For the command line interface
+import platform  # For describing the machine
+import resource  # For the process-wide peak memory
+import tempfile  # For the scratch directory
+import tracemalloc  # For per-stage peak memory
+from contextlib import redirect_stdout  # Progress output goes to stderr, the report to stdout
+import numpy as np  # For the synthetic prices
+
+from price_store import PriceStore, PriceProvider, COLUMNS  # Store and base class of the stub provider
+
+BARS = 2520  # Ten years of trading days, like the real fetch
+SYMBOLS = 3
+REPEAT = 5
+EPOCHS = 2  # Training is the slowest stage by far, the real 50 epochs scale linearly from this
+
+
+# Deterministic random-walk OHLCV bars ending today, the same for the same symbol and length
+def synthetic_ohlcv(symbol: str, bars: int = BARS) -> "pd.DataFrame":
+    import pandas as pd
+
+    rng = np.random.default_rng(int(hashlib.sha256(symbol.encode()).hexdigest()[:8], 16))
+    close = 100 * np.exp(np.cumsum(rng.normal(0.0003, 0.015, bars)))
+    opening = close * (1 + rng.normal(0, 0.005, bars))
+    df = pd.DataFrame({
+        "Open": opening,
+        "High": np.maximum(opening, close) * (1 + rng.random(bars) * 0.01),
+        "Low": np.minimum(opening, close) * (1 - rng.random(bars) * 0.01),
+        "Close": close,
+        "Volume": rng.integers(100_000, 10_000_000, bars).astype(float),
+    }, index=pd.bdate_range(end=pd.Timestamp.today().normalize(), periods=bars, tz="UTC"))
+    return df[COLUMNS]
+
+
+# Price provider serving synthetic bars instead of calling yfinance
+class SyntheticProvider(PriceProvider):
+    def __init__(self, bars: int = BARS):
+        self.bars = bars
+        self.calls = 0
+
+    def history(self, symbol: str, start=None, period: str = "10y") -> "pd.DataFrame":
+        import pandas as pd
+
+        self.calls += 1
+        df = synthetic_ohlcv(symbol, self.bars)
+        if start is not None:
+            df = df[df.index >= pd.Timestamp(start, tz="UTC")]
+        return df
+
+
+# Run `function` and record its wall-clock time and tracemalloc peak under `stage`
+def timed(samples: dict, stage: str, function, *args, **kwargs):
+    tracemalloc.reset_peak()
+    before = tracemalloc.get_traced_memory()[0]
+    started = time.perf_counter()
+    result = function(*args, **kwargs)
+    elapsed = time.perf_counter() - started
+    peak = tracemalloc.get_traced_memory()[1] - before
+    samples.setdefault(stage, []).append((elapsed, peak))
+    return result
+
+
+# Stand-in for a model trained without TensorFlow: a packed NumpyLSTM with random weights
+def random_model(model, units: int = 32):
+    from numpy_lstm import NumpyLSTM
+    from model_store import model_store
+
+    rng = np.random.default_rng(0)
+    features = model.feature_transform.shape[1]
+    lstm = NumpyLSTM(rng.normal(0, 0.1, (features, 4 * units)).astype(np.float32),
+                     rng.normal(0, 0.1, (units, 4 * units)).astype(np.float32),
+                     np.zeros(4 * units, dtype=np.float32),
+                     rng.normal(0, 0.1, (units, 1)).astype(np.float32), np.zeros(1, dtype=np.float32))
+    model_store.add(model.stock, lstm, trained_at=time.time(), scaler=model.scaler)
+
+
+# One cold "start" press per symbol, stage by stage, followed by the end-to-end path on the saved model
+def run(symbols, repeat: int, bars: int, epochs: int, train: bool) -> dict:
+    from model import Model
+    from model_registry import registry
+    from i2c_dev import Lcd, SimulatedSMBus
+
+    provider = SyntheticProvider(bars)
+    bus = SimulatedSMBus()
+    lcd = Lcd(addr=0x27, bus=bus)
+    Model.epochs = epochs
+    samples = {}
+
+    def display(symbol, score):
+        bus_time = bus.bus_time
+        lcd.lcd_show(symbol, f"{score:.2f}")
+        time.sleep(bus.bus_time - bus_time)  # What the transfers take on a real 100 kHz bus
+
+    def press(symbol, use_cache=True):  # What lcd_model does for a start press
+        display(symbol, Model(symbol, store=PriceStore(provider=provider)).start(use_cache=use_cache))
+
+    if train:
+        timed(samples, "import keras", importlib.import_module, "keras")  # Paid once per process, before the first training
+
+    for symbol in symbols:  # Training happens once per symbol, outside the repeats
+        model = Model(symbol, store=PriceStore(provider=provider))
+        timed(samples, "fetch (cold, provider)", model.fetch_data)
+        timed(samples, "scale_features (fit)", model.scale_features)
+        X_train, X_test, y_train, y_test = model.split_data()
+        X_train, X_test = model.prepare_data_for_lstm(X_train, X_test)
+        if train:
+            timed(samples, f"train ({epochs} epochs)", model.build_and_train_lstm, X_train, y_train)
+            timed(samples, "save_model", model.save_model)
+        else:
+            random_model(model)
+
+    for _ in range(repeat):
+        for symbol in symbols:
+            model = Model(symbol, store=PriceStore(provider=provider))
+            registry.discard(model.inference_path())  # Every repeat loads the model from disk
+            timed(samples, "fetch (stored)", model.fetch_data)
+            timed(samples, "scale_features (saved scaler)", model.scale_features)
+            X_train, X_test, y_train, y_test = timed(samples, "split_data", model.split_data)
+            X_train, X_test = timed(samples, "prepare_data_for_lstm", model.prepare_data_for_lstm, X_train, X_test)
+            model.lstm = timed(samples, "load_model", registry.get, model.inference_path())
+            y_pred = timed(samples, "predict", model.lstm.predict, X_test)
+            score = timed(samples, "score_stock", model.score_stock, y_train, X_test, y_test, y_pred=y_pred)
+            timed(samples, "display", display, symbol, score)
+
+            registry.discard(model.inference_path())
+            timed(samples, "end_to_end (cold model, no score cache)", press, symbol, use_cache=False)
+            timed(samples, "end_to_end (score cache hit)", press, symbol)
+
+    return {stage: summarize(values) for stage, values in samples.items()}
+
+
+# Median, min and max of the timings of a stage and its largest memory peak
+def summarize(values) -> dict:
+    seconds = np.array([elapsed for elapsed, _ in values])
+    return {
+        "runs": len(values),
+        "median_s": round(float(np.median(seconds)), 6),
+        "min_s": round(float(seconds.min()), 6),
+        "max_s": round(float(seconds.max()), 6),
+        "peak_bytes": int(max(peak for _, peak in values)),
+    }
+
+
+def machine() -> dict:
+    return {
+        "machine": platform.machine(),
+        "platform": platform.platform(),
+        "python": sys.version.split()[0],
+        "numpy": np.__version__,
+        "cpus": os.cpu_count(),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the stages of a start press.")
+    parser.add_argument("--bars", type=int, default=BARS, help="bars of synthetic history per symbol")
+    parser.add_argument("--symbols", type=int, default=SYMBOLS, help="number of synthetic symbols")
+    parser.add_argument("--repeat", type=int, default=REPEAT, help="timed repeats per symbol")
+    parser.add_argument("--epochs", type=int, default=EPOCHS, help="training epochs")
+    parser.add_argument("--no-train", action="store_true", help="skip TensorFlow, score random NumPy models")
+    parser.add_argument("--output", help="write the JSON report to this file as well")
+    args = parser.parse_args()
+
+    output = os.path.abspath(args.output) if args.output else None
+    workdir = tempfile.mkdtemp(prefix="stock-bench-")
+    os.chdir(workdir)  # Models, prices and scores are relative paths, keep them in the scratch directory
+    os.makedirs("models")
+    tracemalloc.start()
+    started = time.perf_counter()
+    try:
+        with redirect_stdout(sys.stderr):
+            stages = run([f"SYN{n}" for n in range(args.symbols)], args.repeat, args.bars, args.epochs,
+                         train=not args.no_train)
+    finally:
+        os.chdir("/")
+        shutil.rmtree(workdir, ignore_errors=True)
+    report = {
+        "machine": machine(),
+        "config": {"bars": args.bars, "symbols": args.symbols, "repeat": args.repeat, "epochs": args.epochs,
+                   "train": not args.no_train},
+        "stages": stages,
+        "total_s": round(time.perf_counter() - started, 3),
+        "max_rss_bytes": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,  # ru_maxrss is in KiB on Linux
+    }
+    text = json.dumps(report, indent=1)
+    print(text)
+    if output:
+        with open(output, "w") as f:
+            f.write(text + "\n")
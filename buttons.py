@@ -0,0 +1,144 @@
+import time  # For debounce timestamps
+from threading import Thread, Timer, Event, Lock  # For long-press, auto-repeat and debounce timers
+
+# Button wiring (BCM numbering), each button pulls its pin low when pressed
+BUTTON_PINS = {17: "prev", 27: "start", 22: "next"}
+
+DEBOUNCE = 0.03  # Seconds an edge must be apart from the previous one to count
+REPEAT_DELAY = 0.5  # Seconds a repeating button is held before it starts repeating
+REPEAT_INTERVAL = 0.2  # Seconds between repeats while it stays held
+LONG_PRESS = 1.0  # Seconds a button is held to count as a long press
+
+REPEATING = {"prev", "next"}  # Buttons that auto-repeat while held
+LONG_PRESS_COMMANDS = {"start": "refresh"}  # Command sent instead of the short press when held
+
+
+# Stand-in for RPi.GPIO so the button handling can run (and be driven) on a plain Linux box
+class FakeGPIO:
+    BCM = 11
+    IN = 1
+    PUD_UP = 22
+    BOTH = 33
+    HIGH = 1
+    LOW = 0
+
+    def __init__(self):
+        self.levels = {}  # pin -> level
+        self.callbacks = {}  # pin -> edge callback
+
+    def setmode(self, mode):
+        pass
+
+    def setup(self, pin, direction, pull_up_down=None):
+        self.levels[pin] = self.HIGH if pull_up_down == self.PUD_UP else self.LOW
+
+    def input(self, pin):
+        return self.levels[pin]
+
+    def add_event_detect(self, pin, edge, callback=None, bouncetime=None):
+        self.callbacks[pin] = callback
+
+    def remove_event_detect(self, pin):
+        self.callbacks.pop(pin, None)
+
+    def cleanup(self, pins=None):
+        for pin in list(self.callbacks) if pins is None else pins:
+            self.remove_event_detect(pin)
+
+    # Simulate pressing (pulling the pin low) and releasing a button
+    def press(self, pin):
+        self._set(pin, self.LOW)
+
+    def release(self, pin):
+        self._set(pin, self.HIGH)
+
+    def _set(self, pin, level):
+        if self.levels.get(pin) != level:
+            self.levels[pin] = level
+            if pin in self.callbacks:
+                self.callbacks[pin](pin)
+
+
+# The real GPIO module on a Pi, the fake one anywhere else
+def load_gpio():
+    try:
+        import RPi.GPIO as GPIO
+        return GPIO
+    except (ImportError, RuntimeError):
+        print("RPi.GPIO not available, using a fake GPIO backend")
+        return FakeGPIO()
+
+
+# Edge-triggered button input with software debounce, long press and auto-repeat
+class Buttons:
+    def __init__(self, on_command, gpio=None, pins=BUTTON_PINS):
+        self.on_command = on_command  # Called with the command name, e.g. "next"
+        self.gpio = gpio or load_gpio()
+        self.pins = pins
+        self._lock = Lock()
+        self._pressed = {}  # pin -> Event set on release
+        self._last_edge = {}  # pin -> time of the last accepted edge
+        self._resamples = {}  # pin -> Timer reading the pin again after an edge ignored as bounce
+
+    def start(self) -> None:
+        self.gpio.setmode(self.gpio.BCM)
+        for pin in self.pins:
+            self.gpio.setup(pin, self.gpio.IN, pull_up_down=self.gpio.PUD_UP)
+            self.gpio.add_event_detect(pin, self.gpio.BOTH, callback=self._edge)
+
+    def stop(self) -> None:
+        for timer in list(self._resamples.values()):
+            timer.cancel()
+        for released in list(self._pressed.values()):
+            released.set()
+        self.gpio.cleanup(list(self.pins))
+
+    # Called by the GPIO backend on every edge of a button pin
+    def _edge(self, pin) -> None:
+        self._update(pin, debounce=True)
+
+    # An edge was ignored as bounce: the pin may have settled in a new state without another edge
+    # (e.g. a tap shorter than DEBOUNCE), so read it again once the bounce window is over
+    def _resample(self, pin) -> None:
+        with self._lock:
+            self._resamples.pop(pin, None)
+        self._update(pin, debounce=False)
+
+    # Bring the state of a button in line with the level of its pin
+    def _update(self, pin, debounce: bool) -> None:
+        now = time.monotonic()
+        pressed = not self.gpio.input(pin)  # Pulled low while pressed
+        with self._lock:
+            settle = self._last_edge.get(pin, float("-inf")) + DEBOUNCE - now
+            if debounce and settle > 0:  # Contact bounce
+                if pin not in self._resamples:
+                    timer = self._resamples[pin] = Timer(settle, self._resample, args=(pin,))
+                    timer.daemon = True
+                    timer.start()
+                return
+            if pressed == (pin in self._pressed):
+                return  # No change from the last stable state
+            self._last_edge[pin] = now
+            if pressed:
+                released = self._pressed[pin] = Event()
+            else:
+                self._pressed.pop(pin).set()
+                return
+        Thread(target=self._hold, args=(self.pins[pin], released), daemon=True).start()
+
+    # Follow one press until release, sending the short, long or repeated commands
+    def _hold(self, command: str, released: Event) -> None:
+        if command in REPEATING:
+            self.on_command(command)  # Fire on press for snappy scrolling
+            if released.wait(REPEAT_DELAY):
+                return
+            while not released.wait(REPEAT_INTERVAL):
+                self.on_command(command)
+            return
+        if command in LONG_PRESS_COMMANDS:
+            if released.wait(LONG_PRESS):
+                self.on_command(command)  # Released early: a short press
+            else:
+                self.on_command(LONG_PRESS_COMMANDS[command])
+            return
+        self.on_command(command)
@@ -0,0 +1,130 @@
+import time  # For latency measurements
+from collections import deque  # For the recent latency samples
+from queue import Queue, Full  # Bounded queues between the I/O threads and the workers
+from threading import Thread, Lock  # Workers and shared state
+
+import lcd_model  # Command handling and LCD output
+from metrics import metrics  # Per-request tracing
+from model_registry import registry  # For the model cache counters in the stats
+
+COMMAND_QUEUE_SIZE = 32  # Commands waiting to be handled, further commands are dropped
+SCORE_QUEUE_SIZE = 32  # Distinct stocks waiting to be scored
+LATENCY_SAMPLES = 1000  # Number of recent command-to-LCD latencies kept
+
+
+# Event-driven core of the server: Bluetooth clients and buttons submit commands, a command worker
+# updates the LCD and a scoring worker runs the slow Model.start calls off the I/O threads
+class CommandPipeline:
+    def __init__(self, command_queue_size: int = COMMAND_QUEUE_SIZE, score_queue_size: int = SCORE_QUEUE_SIZE):
+        self._commands = Queue(maxsize=command_queue_size)
+        self._scores = Queue(maxsize=score_queue_size)
+        self._pending = {}  # stock -> (submit time, trace) of the commands waiting for its score
+        self._lock = Lock()
+        self._latencies = deque(maxlen=LATENCY_SAMPLES)
+        self._workers = [Thread(target=self._command_worker, daemon=True),
+                         Thread(target=self._score_worker, daemon=True)]
+
+    def start(self) -> None:
+        for worker in self._workers:
+            worker.start()
+
+    # Queue a command from any thread, returns False when the queue is full and the command was dropped
+    def submit(self, message: str) -> bool:
+        try:
+            self._commands.put_nowait((message, time.perf_counter()))
+            return True
+        except Full:
+            print(f"Command queue full, dropped {message!r}")
+            return False
+
+    def _command_worker(self) -> None:
+        while True:
+            message, submitted = self._commands.get()
+            trace = metrics.begin(message, submitted)
+            try:
+                if message in ("start", "refresh"):
+                    self._start(submitted, trace, force=message == "refresh")
+                else:
+                    with metrics.stage("command"):
+                        lcd_model.process_message(message)
+                    self._record(submitted, trace)
+            except Exception as error:  # A bad command must not take the worker down
+                print(f"Command {message!r} failed: {error}")
+                metrics.flag("failed")
+                metrics.finish(trace)
+            metrics.activate(None)
+
+    # Show the cached score at once and hand a refresh to the scoring worker when needed (always when forced)
+    def _start(self, submitted: float, trace, force: bool = False) -> None:
+        with lcd_model.state_lock, metrics.stage("cached_display"):
+            stock = lcd_model.current_stock
+            stale = lcd_model.show_cached_score(stock)
+        metrics.set_symbol(stock)
+        metrics.flag("score_cache_fresh", not stale)
+        if not (stale or force):
+            self._record(submitted, trace)
+            return
+        with self._lock:
+            if stock in self._pending:  # Already queued or running, share its result
+                metrics.flag("coalesced")
+                self._pending[stock].append((submitted, trace))
+                return
+            self._pending[stock] = [(submitted, trace)]
+        metrics.flag("coalesced", False)
+        try:
+            self._scores.put_nowait((stock, force, time.perf_counter()))
+        except Full:
+            with self._lock:
+                del self._pending[stock]
+            print(f"Score queue full, dropped {stock}")
+            metrics.flag("dropped")
+            metrics.finish(trace)
+
+    def _score_worker(self) -> None:
+        while True:
+            stock, force, queued = self._scores.get()
+            with self._lock:
+                trace = self._pending[stock][0][1]  # The command that queued the job carries the stage timings
+            trace.stages["score_queue"] = time.perf_counter() - queued
+            metrics.activate(trace)
+            try:
+                lcd_model.refresh_score(stock, force)
+            except Exception as error:
+                print(f"Scoring {stock} failed: {error}")
+                metrics.flag("failed")
+            metrics.activate(None)
+            with self._lock:
+                waiting = self._pending.pop(stock, [])
+            for submitted, trace in waiting:
+                self._record(submitted, trace)
+
+    # The command is done: keep its latency and store its trace
+    def _record(self, submitted: float, trace=None) -> None:
+        self._latencies.append(time.perf_counter() - submitted)
+        if trace is not None:
+            metrics.finish(trace)
+
+    # p50/p99 command-to-LCD latency in milliseconds over the recent commands
+    def latency_percentiles(self) -> dict:
+        samples = sorted(self._latencies)
+        if not samples:
+            return {"count": 0, "p50_ms": None, "p99_ms": None}
+        pick = lambda q: samples[min(len(samples) - 1, int(q * len(samples)))] * 1000
+        return {"count": len(samples), "p50_ms": pick(0.50), "p99_ms": pick(0.99)}
+
+    # Number of commands and score jobs waiting
+    def backlog(self) -> dict:
+        return {"commands": self._commands.qsize(), "scores": self._scores.qsize()}
+
+    # Everything the `stats` command and the metrics endpoint report
+    def stats(self) -> dict:
+        return {
+            "requests": metrics.summary(),
+            "latency": self.latency_percentiles(),
+            "backlog": self.backlog(),
+            "models": registry.stats(),
+        }
+
+
+# Shared pipeline used by the server
+pipeline = CommandPipeline()
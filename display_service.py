@@ -0,0 +1,104 @@
+import time  # For frame timing
+from threading import Thread, Condition  # Render thread and the frame slot it waits on
+
+from i2c_dev import Lcd  # Custom module for LCD control
+
+MAX_FPS = 10  # Upper bound on screen refreshes per second
+SCROLL_INTERVAL = 0.4  # Seconds between scroll steps of lines longer than the display
+SCROLL_GAP = "   "  # Spacing between the end and the restart of a scrolling line
+RETRY_INTERVAL = 1.0  # Seconds before a frame that failed to draw is tried again
+
+
+# Single owner of the LCD: callers post what to show and return at once, a render thread draws the
+# newest frame (older, never-drawn frames are dropped), at most MAX_FPS times per second
+class DisplayService:
+    def __init__(self, lcd_factory=Lcd, cols: int = 16, rows: int = 2, max_fps: float = MAX_FPS):
+        self.lcd_factory = lcd_factory  # Called on the render thread, so importing this module touches no hardware
+        self.cols = cols
+        self.rows = rows
+        self.min_interval = 1 / max_fps
+        self._cond = Condition()
+        self._frame = ()  # Lines of the newest frame
+        self._version = 0  # Bumped on every posted frame
+        self._drawn = 0  # Version of the frame last drawn
+        self.dropped = 0  # Frames replaced before they were drawn
+        self._thread = None
+        self._stopped = False
+
+    # Show the given lines (missing lines are blank, long lines scroll)
+    def show(self, *lines) -> None:
+        with self._cond:
+            if self._version != self._drawn:
+                self.dropped += 1
+            self._frame = tuple(str(line) for line in lines[:self.rows])
+            self._version += 1
+            self._cond.notify()
+        if self._thread is None:
+            self.start()
+
+    # Show progress such as "Training AAPL 37/50" with a bar underneath
+    def progress(self, label: str, done: int, total: int) -> None:
+        filled = self.cols * done // total if total else 0
+        self.show(f"{label} {done}/{total}", "#" * filled)
+
+    def clear(self) -> None:
+        self.show()
+
+    def start(self) -> None:
+        with self._cond:
+            if self._thread is None:
+                self._thread = Thread(target=self._run, daemon=True)
+                self._thread.start()
+
+    def stop(self) -> None:
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+
+    # Window of a line at a scroll step
+    def _scrolled(self, line: str, step: int) -> str:
+        if len(line) <= self.cols:
+            return line
+        loop = line + SCROLL_GAP
+        offset = step % len(loop)
+        return (loop + loop)[offset:offset + self.cols]
+
+    def _run(self) -> None:
+        lcd = None  # Created on the first draw, and again after a failed one
+        step, last_draw, next_scroll = 0, 0.0, None
+        while True:
+            with self._cond:
+                # Sleep until a new frame arrives or the current one needs its next scroll step
+                while not self._stopped and self._version == self._drawn:
+                    timeout = None if next_scroll is None else next_scroll - time.monotonic()
+                    if timeout is not None and timeout <= 0:
+                        break
+                    self._cond.wait(timeout)
+                if self._stopped:
+                    return
+
+            wait = last_draw + self.min_interval - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)  # Rate limit, frames posted meanwhile replace this one
+
+            with self._cond:
+                step = 0 if self._version != self._drawn else step + 1  # A new frame starts unscrolled
+                frame, self._drawn = self._frame, self._version
+            try:
+                if lcd is None:
+                    lcd = self.lcd_factory()
+                lcd.lcd_show(*(self._scrolled(line, step) for line in frame), *[""] * (self.rows - len(frame)))
+            except Exception as error:  # I2C errors happen on the Pi, the thread must outlive them
+                print(f"LCD update failed: {error}")
+                lcd = None  # Initialised again on the retry, which also resets its framebuffer
+                last_draw = time.monotonic()
+                step -= 1  # The retry draws the same scroll step (or the new frame, unscrolled)
+                next_scroll = last_draw + RETRY_INTERVAL
+                continue
+            last_draw = time.monotonic()
+            scrolling = any(len(line) > self.cols for line in frame)
+            next_scroll = last_draw + SCROLL_INTERVAL if scrolling else None
+
+
+# Shared display used by every caller
+display = DisplayService()
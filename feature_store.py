@@ -0,0 +1,108 @@
+import os  # For interacting with the operating system
+import json  # For reading and writing the manifest
+import fcntl  # For serializing manifest updates
+import tempfile  # For unique temporary file names
+import hashlib  # For identifying scalers
+import numpy as np  # For the on-disk feature arrays
+
+from price_store import COLUMNS  # Column order of the stored price rows
+
+FEATURES = ["Open", "High", "Low", "Volume"]  # Model inputs, scaled to [0, 1]
+FEATURE_INDEX = [COLUMNS.index(name) + 1 for name in FEATURES]  # Their columns in the price rows
+FEATURES_DIR = "features"  # Default directory for the prepared features
+
+
+# Min-max scaler parameters fitted on price rows, the same numbers sklearn's MinMaxScaler would fit.
+# Kept as a plain dict so they can be stored in the model metadata
+def fit_scaler(rows) -> dict:
+    values = np.asarray(rows[:, FEATURE_INDEX], dtype=np.float64)
+    return {"min": values.min(axis=0).tolist(), "max": values.max(axis=0).tolist()}
+
+
+# Scale the feature columns of price rows with fitted parameters (constant columns map to 0 like sklearn)
+def transform(rows, scaler: dict) -> np.ndarray:
+    low, high = np.asarray(scaler["min"]), np.asarray(scaler["max"])
+    span = np.where(high - low == 0, 1.0, high - low)
+    return (np.asarray(rows[:, FEATURE_INDEX], dtype=np.float64) - low) / span
+
+
+# Short digest identifying scaler parameters, stored features are only reused with the same scaler
+def scaler_key(scaler: dict) -> str:
+    return hashlib.sha256(json.dumps(scaler, sort_keys=True).encode()).hexdigest()[:16]
+
+
+# Scaled features of each symbol as rows of [timestamp, Open, High, Low, Volume], memory-mapped and
+# tied to the scaler they were prepared with. Only bars added since the last call get scaled
+class FeatureStore:
+    def __init__(self, directory: str = FEATURES_DIR):
+        self.directory = directory
+        self.manifest_path = os.path.join(directory, "manifest.json")
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, symbol: str) -> str:
+        return os.path.join(self.directory, f"{symbol}.npy")
+
+    def _read_manifest(self) -> dict:
+        try:
+            with open(self.manifest_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    # Update one manifest entry under a lock file, so concurrent writers (threads or processes) never
+    # drop each other's entries
+    def _write_manifest_entry(self, symbol: str, entry: dict) -> None:
+        with open(f"{self.manifest_path}.lock", "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            manifest = self._read_manifest()
+            manifest[symbol] = entry
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix=".manifest.", suffix=".tmp")
+            with os.fdopen(fd, "w") as f:
+                json.dump(manifest, f, indent=1, sort_keys=True)
+            os.replace(tmp_path, self.manifest_path)
+
+    # Stored features of a symbol, None when missing or prepared with a different scaler
+    def load(self, symbol: str, key: str):
+        entry = self._read_manifest().get(symbol)
+        if not entry or entry.get("key") != key or not os.path.exists(self._path(symbol)):
+            return None
+        return np.load(self._path(symbol), mmap_mode="r")
+
+    def _save(self, symbol: str, key: str, features: np.ndarray) -> None:
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix=f".{symbol}.", suffix=".tmp.npy")
+        with os.fdopen(fd, "wb") as f:  # A unique name, so concurrent writers never share a temp file
+            np.save(f, features)
+        os.replace(tmp_path, self._path(symbol))
+        self._write_manifest_entry(symbol, {"key": key, "rows": int(len(features))})
+
+    # Scaled features for the price rows of a symbol. `key` identifies the scaler (see scaler_key):
+    # stored features are reused for every bar before the last stored one (that bar may have been
+    # partial and is scaled again), rows that fell out of the history window are dropped
+    def get(self, symbol: str, rows, scaler: dict, key: str) -> np.ndarray:
+        stored = self.load(symbol, key)
+        if stored is not None and len(stored):
+            last = stored[-1, 0]
+            prefix = rows[rows[:, 0] < last]
+            kept = stored[(stored[:, 0] >= rows[0, 0]) & (stored[:, 0] < last)]
+            if len(kept) == len(prefix) and np.array_equal(kept[:, 0], prefix[:, 0]):
+                appended = rows[len(prefix):]
+                if len(appended) == 1 and appended[0, 0] == last and len(kept) == len(stored) - 1 \
+                        and np.array_equal(transform(appended, scaler)[0], stored[-1, 1:]):
+                    return stored  # Nothing new since the last call
+                features = np.concatenate([kept, self._scaled(appended, scaler)])
+                self._save(symbol, key, features)
+                return features
+        features = self._scaled(rows, scaler)  # No usable features yet, scale everything once
+        self._save(symbol, key, features)
+        return features
+
+    @staticmethod
+    def _scaled(rows, scaler: dict) -> np.ndarray:
+        features = np.empty((len(rows), len(FEATURES) + 1))
+        features[:, 0] = rows[:, 0]
+        features[:, 1:] = transform(rows, scaler)
+        return features
+
+
+# Shared store used by Model
+feature_store = FeatureStore()
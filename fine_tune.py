@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""fine_tune.py
+
+Fine-tune the saved models on the bars added since they were last trained, instead of retraining them
+from scratch or reusing them unchanged. Every refresh is logged with its wall-clock and CPU time.
+
+Usage: python3 fine_tune.py [SYMBOL ...] [--epochs N] [--workers N] [--schedule] [--interval SECONDS] [--memory-budget MIB]
+Without symbols every packed model is refreshed; --schedule keeps refreshing the catalogue every interval.
+
+"""
+
+import os  # For passing the memory budget to the workers
+import json  # For the refresh log
+import time  # For timing the refreshes
+import argparse  # For the command line interface
+from functools import partial  # For passing the epochs to the workers
+
+from model_store import model_store  # Packed store of every model's weights
+from training_farm import TrainingFarm, TRAIN_WORKERS  # Pool of training processes
+
+FINE_TUNE_LOG = "fine_tune.jsonl"  # One JSON record per refresh
+FINE_TUNE_INTERVAL = 24 * 60 * 60  # Seconds between scheduled refreshes of the catalogue (one new bar a day)
+
+
+# Append a refresh record to the log and print it
+def log_refresh(record: dict, path: str = FINE_TUNE_LOG) -> None:
+    with open(path, "a") as f:
+        f.write(json.dumps(record, sort_keys=True) + "\n")
+    print(f"{record['symbol']}: {record['bars']} new bars, {record['wall_s']:.1f}s wall, {record['cpu_s']:.1f}s CPU")
+
+
+# Fine-tune the model of one symbol and log how long it took (runs inside a training farm worker)
+def fine_tune_symbol(symbol: str, epochs: int = None) -> str:
+    from model import Model  # Imported in the worker so TensorFlow loads after the thread limits are set
+
+    started, cpu_started = time.perf_counter(), time.process_time()
+    model = Model(symbol)
+    model.fetch_data()  # Raises ValueError for unknown symbols
+    bars = model.fine_tune(epochs)
+    log_refresh({
+        "symbol": symbol,
+        "bars": bars,
+        "epochs": (epochs or model.fine_tune_epochs) if bars else 0,
+        "wall_s": round(time.perf_counter() - started, 3),
+        "cpu_s": round(time.process_time() - cpu_started, 3),  # Includes TensorFlow's threads in the worker
+        "peak_rss_bytes": model.peak_rss,  # None when there was nothing to train on
+        "at": time.time(),
+    })
+    return model.model_path
+
+
+# Fine-tune every symbol in the farm and wait for them, returns the symbols that failed with their errors
+def refresh_catalogue(symbols, farm: TrainingFarm, epochs: int = None) -> dict:
+    failed = {}
+    task = partial(fine_tune_symbol, epochs=epochs)
+    for symbol in symbols:
+        farm.submit(symbol, task=task, on_done=lambda symbol, error: error and failed.update({symbol: str(error)}))
+    farm.shutdown(wait=True)  # The farm starts its workers again on the next submit
+    for symbol, error in failed.items():
+        print(f"{symbol}: fine-tuning failed: {error}")
+    return failed
+
+
+# Refresh the catalogue now and then every `interval` seconds (the catalogue is re-read every run)
+def run_schedule(farm: TrainingFarm, interval: float = FINE_TUNE_INTERVAL, symbols=None, epochs: int = None) -> None:
+    while True:
+        started = time.time()
+        refresh_catalogue(symbols or model_store.symbols(), farm, epochs)
+        time.sleep(max(0.0, started + interval - time.time()))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fine-tune saved models on their new bars.")
+    parser.add_argument("symbols", nargs="*", help="symbols to refresh (default: every packed model)")
+    parser.add_argument("--epochs", type=int, default=None, help="epochs over the new bars")
+    parser.add_argument("--workers", type=int, default=TRAIN_WORKERS, help="number of worker processes")
+    parser.add_argument("--schedule", action="store_true", help="keep refreshing every interval")
+    parser.add_argument("--interval", type=float, default=FINE_TUNE_INTERVAL, help="seconds between scheduled runs")
+    parser.add_argument("--memory-budget", type=int, help="MiB per training job (default: a share of the RAM)")
+    args = parser.parse_args()
+
+    if args.memory_budget:  # Models keep the lookback they were trained with, only the budget applies here
+        os.environ["TRAIN_MEMORY_BUDGET_MB"] = str(args.memory_budget)
+
+    farm = TrainingFarm(workers=args.workers)
+    symbols = [symbol.upper() for symbol in args.symbols]
+    if args.schedule:
+        run_schedule(farm, args.interval, symbols, args.epochs)
+    else:
+        refresh_catalogue(symbols or model_store.symbols(), farm, args.epochs)
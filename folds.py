@@ -0,0 +1,28 @@
+import numpy as np  # For the fold statistics
+
+
+# Boundaries of the folds sklearn's TimeSeriesSplit would produce, as (train_end, test_start, test_end)
+# index triples computed arithmetically: fold k trains on [0, train_end) and tests on [test_start, test_end)
+def time_series_folds(n_samples: int, n_splits: int = 10, test_size: int = None, gap: int = 0) -> list:
+    test_size = test_size or n_samples // (n_splits + 1)
+    if n_splits < 2 or test_size < 1 or n_samples - gap - n_splits * test_size <= 0:
+        raise ValueError(f"Cannot make {n_splits} folds out of {n_samples} samples")
+    first_test = n_samples - n_splits * test_size
+    return [(start - gap, start, start + test_size) for start in range(first_test, n_samples, test_size)]
+
+
+# The last fold, the one a single score is computed on
+def last_fold(n_samples: int, n_splits: int = 10) -> tuple:
+    return time_series_folds(n_samples, n_splits)[-1]
+
+
+# Summary of per-fold scores from a walk-forward evaluation: the spread tells how stable a model's
+# score is over time, the final fold is the score reported for the symbol
+def fold_stability(scores) -> dict:
+    scores = np.asarray(scores, dtype=np.float64)
+    return {
+        "folds": [round(float(score), 4) for score in scores],
+        "mean": float(scores.mean()),
+        "std": float(scores.std()),
+        "min": float(scores.min()),
+    }
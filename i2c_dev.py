@@ -1,6 +1,16 @@
-from smbus import SMBus
-from RPi.GPIO import RPI_REVISION
-from time import sleep
+try:
+    from smbus2 import SMBus, i2c_msg  # smbus2 also supports raw i2c_rdwr transfers
+except ImportError:
+    try:
+        from smbus import SMBus
+    except ImportError:
+        SMBus = None  # No I2C library, only the simulated bus can be used
+    i2c_msg = None
+try:
+    from RPi.GPIO import RPI_REVISION
+except (ImportError, RuntimeError):
+    RPI_REVISION = 3  # Not running on a Pi (e.g. with the simulated bus), assume a current board
+from time import sleep, perf_counter
 from re import findall, match
 from subprocess import check_output
 from os.path import exists
@@ -52,13 +62,25 @@ LCD_BACKLIGHT = 0x08
 LCD_NOBACKLIGHT = 0x00
 SESSION_STATE_BACKLIGHT = ''
 
+# HD44780 execution times from the datasheet (270 kHz oscillator)
+LCD_EXEC_TIME = 0.000037  # Most instructions and data writes
+LCD_SLOW_EXEC_TIME = 0.00152  # Clear display and return home
+LCD_INIT_WAIT = 0.0041  # After each function set while initializing
+# One byte to the backpack takes 9 clocks (90 us at 100 kHz), longer than LCD_EXEC_TIME and the
+# 450 ns enable pulse, so consecutive bytes need no sleeps; only the slow instructions wait
+
+I2C_BLOCK_SIZE = 32  # Data bytes per SMBus block write
+
+# DDRAM address of the first character of each line
+LCD_ROW_OFFSETS = [0x00, 0x40, 0x14, 0x54]
+
 # Bit masks for controlling the LCD
 En = 0b00000100  # Enable bit
 Rw = 0b00000010  # Read/Write bit
 Rs = 0b00000001  # Register select bit
 
 class I2CDevice:
-    def __init__(self, addr=None, addr_default=None, bus=BUS_NUMBER):
+    def __init__(self, addr=None, addr_default=None, bus=BUS_NUMBER, smbus=None):
         if not addr:
             # Try to autodetect the I2C address, otherwise use the default if provided
             try:
@@ -69,7 +91,7 @@ class I2CDevice:
                 self.addr = addr_default
         else:
             self.addr = addr
-        self.bus = SMBus(bus)  # Initialize the I2C bus
+        self.bus = smbus if smbus is not None else SMBus(bus)  # Initialize the I2C bus (or use the one given)
 
     # Write a single command to the device
     def write_cmd(self, cmd):
@@ -86,6 +108,23 @@ class I2CDevice:
         self.bus.write_block_data(self.addr, cmd, data)
         sleep(0.0001)
 
+    # Write a sequence of bytes in as few bus transactions as the bus supports
+    def write_bytes(self, data):
+        data = list(data)
+        if i2c_msg is not None and hasattr(self.bus, "i2c_rdwr"):
+            self.bus.i2c_rdwr(i2c_msg.write(self.addr, data))  # One raw transfer for the whole sequence
+        elif hasattr(self.bus, "write_i2c_block_data"):
+            # The backpack has no registers, so the "command" byte is simply the first byte of each block
+            for start in range(0, len(data), I2C_BLOCK_SIZE + 1):
+                chunk = data[start:start + I2C_BLOCK_SIZE + 1]
+                if len(chunk) == 1:
+                    self.bus.write_byte(self.addr, chunk[0])
+                else:
+                    self.bus.write_i2c_block_data(self.addr, chunk[0], chunk[1:])
+        else:
+            for byte in data:
+                self.bus.write_byte(self.addr, byte)
+
     # Read a single byte from the device
     def read(self):
         return self.bus.read_byte(self.addr)
@@ -100,19 +139,66 @@ class I2CDevice:
 
 
 class Lcd:
-    def __init__(self, addr=None):
+    def __init__(self, addr=None, cols=16, rows=2, bus=None, bulk=True):
         self.addr = addr
-        self.lcd = I2CDevice(addr=self.addr, addr_default=0x27)  # Default I2C address is 0x27
+        self.cols = cols  # 16x2 by default, 20x4 displays work too
+        self.rows = rows
+        self.bulk = bulk  # Send whole byte sequences per transfer instead of one byte per transaction
+        self.lcd = I2CDevice(addr=self.addr, addr_default=0x27, smbus=bus)  # Default I2C address is 0x27
         # Initialize the LCD display
-        self.lcd_write(0x03)
-        self.lcd_write(0x03)
-        self.lcd_write(0x03)
-        self.lcd_write(0x02)
+        for cmd in (0x03, 0x03, 0x03, 0x02):
+            self.lcd_write(cmd)
+            sleep(LCD_INIT_WAIT)
         self.lcd_write(LCD_FUNCTIONSET | LCD_2LINE | LCD_5x8DOTS | LCD_4BITMODE)
         self.lcd_write(LCD_DISPLAYCONTROL | LCD_DISPLAYON)
         self.lcd_write(LCD_CLEARDISPLAY)
         self.lcd_write(LCD_ENTRYMODESET | LCD_ENTRYLEFT)
         sleep(0.2)
+        self._reset_framebuffer(" ")  # The display is blank after LCD_CLEARDISPLAY
+
+    # Shadow copy of what the display shows, one list of characters per line (None = unknown)
+    def _reset_framebuffer(self, char):
+        self.framebuffer = [[char] * self.cols for _ in range(self.rows)]
+
+    # Record characters written at the start of a line by the direct string writers
+    def _track_line(self, chars, line):
+        if 1 <= line <= self.rows:
+            row = self.framebuffer[line - 1]
+            row[:len(chars)] = chars[:self.cols]
+            del row[self.cols:]
+
+    # Show the given lines, writing only the characters that differ from what is on the display
+    def lcd_show(self, *lines):
+        writes, shown = [], {}
+        for row, text in enumerate(lines[:self.rows]):
+            wanted = list(text[:self.cols].ljust(self.cols))
+            current = self.framebuffer[row]
+            for start, end in self._changed_runs(current, wanted):
+                writes.append((LCD_SETDDRAMADDR | (LCD_ROW_OFFSETS[row] + start), 0))
+                writes += [(ord(char), Rs) for char in wanted[start:end]]
+            shown[row] = wanted
+        try:
+            self.lcd_write_sequence(writes)
+        except Exception:
+            for row in shown:  # Some of the writes may have landed, the next show rewrites these lines in full
+                self.framebuffer[row] = [None] * self.cols
+            raise
+        for row, wanted in shown.items():
+            self.framebuffer[row] = wanted
+
+    # Runs of changed columns as (start, end) pairs; runs one unchanged character apart are merged,
+    # since rewriting that character costs the same as setting the address again
+    @staticmethod
+    def _changed_runs(current, wanted):
+        runs = []
+        for col, (old, new) in enumerate(zip(current, wanted)):
+            if old == new:
+                continue
+            if runs and col - runs[-1][1] <= 1:
+                runs[-1][1] = col + 1
+            else:
+                runs.append([col, col + 1])
+        return runs
 
     # Pulse the enable bit to latch commands
     def lcd_strobe(self, data):
@@ -134,51 +220,70 @@ class Lcd:
         self.lcd.write_cmd(data | LCD)
         self.lcd_strobe(data)
 
+    # Encode a command or character as backpack bytes: for each nibble set the data, raise Enable, drop it
+    def lcd_encode(self, cmd, mode=0):
+        if SESSION_STATE_BACKLIGHT == 0:
+            LCD = LCD_NOBACKLIGHT
+        else:
+            LCD = LCD_BACKLIGHT
+        encoded = []
+        for data in (mode | (cmd & 0xF0), mode | ((cmd << 4) & 0xF0)):
+            encoded += [data | LCD, data | En | LCD, (data & ~En) | LCD]
+        return encoded
+
     # Write a command to the LCD
     def lcd_write(self, cmd, mode=0):
-        self.lcd_write_four_bits(mode | (cmd & 0xF0))
-        self.lcd_write_four_bits(mode | ((cmd << 4) & 0xF0))
+        if self.bulk:
+            self.lcd.write_bytes(self.lcd_encode(cmd, mode))
+        else:
+            self.lcd_write_four_bits(mode | (cmd & 0xF0))
+            self.lcd_write_four_bits(mode | ((cmd << 4) & 0xF0))
+        if mode == 0 and cmd in (LCD_CLEARDISPLAY, LCD_RETURNHOME):
+            sleep(LCD_SLOW_EXEC_TIME)
+
+    # Write a list of (cmd, mode) pairs, as a single transfer in bulk mode
+    def lcd_write_sequence(self, writes):
+        if not self.bulk:
+            for cmd, mode in writes:
+                self.lcd_write(cmd, mode)
+            return
+        self.lcd.write_bytes([byte for cmd, mode in writes for byte in self.lcd_encode(cmd, mode)])
+
+    # Set the cursor to the beginning of the specified line (as a (cmd, mode) pair)
+    @staticmethod
+    def _line_start(line):
+        return (LCD_SETDDRAMADDR | LCD_ROW_OFFSETS[line - 1], 0)
 
     # Display a string on the LCD
     def lcd_display_string(self, string, line):
-        # Set the cursor to the beginning of the specified line
-        if line == 1:
-            self.lcd_write(0x80)
-        if line == 2:
-            self.lcd_write(0xC0)
-        if line == 3:
-            self.lcd_write(0x94)
-        if line == 4:
-            self.lcd_write(0xD4)
-        # Write each character of the string
-        for char in string:
-            self.lcd_write(ord(char), Rs)
+        # Set the cursor to the beginning of the specified line, then write each character of the string
+        writes = [self._line_start(line)] if 1 <= line <= 4 else []
+        writes += [(ord(char), Rs) for char in string]
+        self.lcd_write_sequence(writes)
+        self._track_line(list(string), line)
 
     # Display an extended string on the LCD
     def lcd_display_extended_string(self, string, line):
         # Set the cursor to the beginning of the specified line
-        if line == 1:
-            self.lcd_write(0x80)
-        if line == 2:
-            self.lcd_write(0xC0)
-        if line == 3:
-            self.lcd_write(0x94)
-        if line == 4:
-            self.lcd_write(0xD4)
+        writes = [self._line_start(line)] if 1 <= line <= 4 else []
+        # Extended characters do not map to the framebuffer, so the line is marked unknown
+        self._track_line([None] * self.cols, line)
         # Process the string for extended characters
         while string:
             result = match(r'\{0[xX][0-9a-fA-F]{2}\}', string)
             if result:
-                self.lcd_write(int(result.group(0)[1:-1], 16), Rs)
+                writes.append((int(result.group(0)[1:-1], 16), Rs))
                 string = string[6:]
             else:
-                self.lcd_write(ord(string[0]), Rs)
+                writes.append((ord(string[0]), Rs))
                 string = string[1:]
+        self.lcd_write_sequence(writes)
 
     # Clear the LCD display and reset the cursor to the home position
     def lcd_clear(self):
         self.lcd_write(LCD_CLEARDISPLAY)
         self.lcd_write(LCD_RETURNHOME)
+        self._reset_framebuffer(" ")
 
     # Control the LCD backlight (on/off)
     def lcd_backlight(self, state):
@@ -191,6 +296,58 @@ class Lcd:
         if state == 1 or state == 0:  # Save backlight settings
             SESSION_STATE_BACKLIGHT = state
 
+# In-memory stand-in for SMBus: records every byte written and how long the transfers would take on a real bus
+class SimulatedSMBus:
+    def __init__(self, clock_hz=100000):
+        self.clock_hz = clock_hz
+        self.written = []  # Every byte written, in order
+        self.transactions = 0
+        self.bus_time = 0.0  # Seconds the transfers would take at clock_hz
+
+    def _transfer(self, data):
+        self.written += data
+        self.transactions += 1
+        self.bus_time += (2 + 9 * (len(data) + 1)) / self.clock_hz  # Start/stop plus address and data bytes, 9 clocks each
+
+    def write_byte(self, addr, value):
+        self._transfer([value])
+
+    def write_byte_data(self, addr, cmd, value):
+        self._transfer([cmd, value])
+
+    def write_block_data(self, addr, cmd, data):
+        self._transfer([cmd, len(data)] + list(data))
+
+    def write_i2c_block_data(self, addr, cmd, data):
+        self._transfer([cmd] + list(data))
+
+    def i2c_rdwr(self, *messages):
+        for message in messages:
+            self._transfer(list(message))
+
+    def read_byte(self, addr):
+        return 0
+
+    def read_byte_data(self, addr, cmd):
+        return 0
+
+    def read_block_data(self, addr, cmd):
+        return []
+
+
+# Characters per second through the driver on a simulated bus (wall-clock time including sleeps, plus modelled bus time)
+def benchmark(chars=320, bulk=True, clock_hz=100000):
+    bus = SimulatedSMBus(clock_hz)
+    lcd = Lcd(addr=0x27, bus=bus, bulk=bulk)
+    bus_time, transactions = bus.bus_time, bus.transactions
+    started = perf_counter()
+    for i in range(chars // lcd.cols):
+        lcd.lcd_display_string("0123456789ABCDEF"[:lcd.cols], i % lcd.rows + 1)
+    elapsed = perf_counter() - started + bus.bus_time - bus_time
+    return {"bulk": bulk, "chars": chars, "seconds": elapsed, "chars_per_second": chars / elapsed,
+            "transactions": bus.transactions - transactions}
+
+
 class CustomCharacters:
     def __init__(self, lcd):
         self.lcd = lcd
@@ -275,3 +432,8 @@ class CustomCharacters:
                 line = self.chars_list[char_num][line_num]
                 binary_str_cmd = "0b000{0}".format(line)
                 self.lcd.lcd_write(int(binary_str_cmd, 2), Rs)
+
+
+if __name__ == "__main__":
+    for bulk in (False, True):
+        print(benchmark(bulk=bulk))
@@ -1,30 +1,32 @@
 from model import Model  # Import the Model class from model module
-from i2c_dev import Lcd  # Import the Lcd class from i2c_dev module
+from model_registry import registry  # Process-wide cache of loaded models
+from score_cache import score_cache  # Persistent cache of computed scores
+from training_farm import farm  # Pool of processes training missing models
+from display_service import display  # The single owner of the LCD
+from metrics import metrics  # Per-request stage timings
+from rankings import ranking_table  # Nightly ranked scores of the whole catalogue
 from time import sleep  # Import sleep function for delays
-import RPi.GPIO as GPIO
-
-GPIO.setmode(GPIO.BCM)
-prev_button = 17
-start_button = 27
-next_button = 22
-
-GPIO.setup(prev_button, GPIO.IN)
-GPIO.setup(start_button, GPIO.IN)
-GPIO.setup(next_button, GPIO.IN)
-
-# Initialize the LCD display
-display = Lcd()
+from threading import Thread, Lock  # For refreshing stale scores in the background
 
 # Define default stocks to scroll through
 default_stocks = ["AAPL", "GOOG", "META", "TSLA", "MSFT"]
 default_stock_index = 0  # Index to keep track of the current stock
 
 current_stock = default_stocks[0]
+refreshing = set()  # Stocks whose score is being refreshed in the background
+state_lock = Lock()  # Guards current_stock and default_stock_index, commands arrive from several threads
 
-# Function to scroll through stocks based on the message received
+# Function to scroll through stocks based on the message received: in score order through the nightly
+# ranking when there is one, otherwise through the default stocks
 def scroll_stocks(message: str):
     global default_stock_index, current_stock
 
+    ranking_table.reload()  # Cheap when the table did not change
+    row = ranking_table.step(current_stock, 1 if message == "next" else -1)
+    if row is not None:
+        current_stock = row["symbol"]
+        return
+
     # Update the default_stock_index based on the message
     if message == "next":
         default_stock_index = (default_stock_index + 1) % len(default_stocks)  # Go to the next stock
@@ -32,26 +34,96 @@ def scroll_stocks(message: str):
         default_stock_index = (default_stock_index - 1) % len(default_stocks)  # Go to the previous stock
     current_stock = default_stocks[default_stock_index]  # Get the current stock
 
+# Load the models of the default stocks ahead of time so the first presses are fast
+def prewarm_models() -> None:
+    models = [Model(stock) for stock in default_stocks]
+    registry.prewarm(model.inference_path() for model in models if model.has_model())
+
 def confirm_stock():
 	global current_stock
 	start_model(current_stock)
 
+# Show a stock's score on the LCD
+def show_score(stock: str, score) -> None:
+    with metrics.stage("display"):
+        display.show(stock, f"{score:.2f}")  # Stock symbol on the first line, score on the second
+
+# Show a stock with its precomputed score, if there is one: its place in the nightly ranking, or else its
+# cached score, marked stale when it was computed before the latest stored bar
+def show_precomputed(stock: str) -> None:
+    ranking_table.reload()
+    row = ranking_table.get(stock)
+    if row is not None:
+        label, last_bar = f"#{row['rank']} {row['score']:.2f}", row["last_bar"]
+    else:
+        entry = score_cache.lookup(stock)
+        if entry is None:
+            display.show(stock, "")
+            return
+        label, last_bar = f"{entry['score']:.2f}", entry["fingerprint"]["last_bar"]
+    if ranking_table.is_stale(stock, last_bar):
+        label += " stale"
+    display.show(stock, label)
+
+# Show whatever score is cached for a stock, returns True when it needs to be (re)computed
+def show_cached_score(stock: str) -> bool:
+    entry = score_cache.lookup(stock)
+    if entry is None:
+        display.show(stock, "Scoring...")
+        return True
+    show_score(stock, entry["score"])  # Show the cached score immediately
+    return score_cache.is_stale(entry)
+
 # Function to initialize and start the model for a given stock
 def start_model(stock: str) -> None:
+    if show_cached_score(stock) and stock not in refreshing:
+        refreshing.add(stock)
+        Thread(target=refresh_score, args=(stock,), daemon=True).start()  # Compute it in the background
+
+# Train a missing model in the background and show "Training..." meanwhile
+def train_model(stock: str) -> None:
+    farm.submit(stock, on_done=training_done, on_progress=training_progress)
+    display.show(stock, "Training...")
+
+# Called by the training farm after every epoch
+def training_progress(stock: str, epoch: int, epochs: int) -> None:
+    if stock == current_stock:
+        display.progress(f"Training {stock}", epoch, epochs)
+
+# Called by the training farm when a model finished training
+def training_done(stock: str, error) -> None:
+    if stock != current_stock:
+        return  # The user moved on, the score is computed when they come back
+    if error is None:
+        Thread(target=refresh_score, args=(stock,), daemon=True).start()
+    elif isinstance(error, ValueError):
+        display.show(stock, "Not Found!")
+    else:
+        display.show(stock, "Training failed")
+
+# Compute a stock's score and show it, unless the user has moved on to another stock meanwhile
+# (force skips the score cache, e.g. after a long press on start)
+def refresh_score(stock: str, force: bool = False) -> None:
     try:
         model = Model(stock)  # Create a Model instance for the given stock
-        score = model.start()  # Start the model and get the score
-        score = score[0] if not isinstance(score, int) else score  # Handle score format
-        display.lcd_clear()  # Clear the LCD display
-        display.lcd_display_string(stock, 1)  # Display the stock symbol on the first line
-        display.lcd_display_string(str(score), 2)  # Display the score on the second line
+        if not model.has_model():
+            model.fetch_data()  # Unknown symbols fail here (a store read) instead of after starting a worker
+            train_model(stock)  # Never train inside the request path
+            return
+        score = model.start(use_cache=not force)  # Start the model and get the score
+        if stock == current_stock:
+            show_score(stock, score)
     except ValueError:  # Handle the case where the stock is not found
-        display.lcd_clear()  # Clear the LCD display
-        display.lcd_display_string(stock, 1)  # Display the stock symbol on the first line
-        display.lcd_display_string("Not Found!", 2)  # Display "Not Found!" on the second line
+        display.show(stock, "Not Found!")  # Display "Not Found!" under the stock symbol
+    finally:
+        refreshing.discard(stock)
 
 # Function to process incoming messages and update the display accordingly
 def process_message(message: str):
+    with state_lock:
+        handle_message(message)
+
+def handle_message(message: str):
     global current_stock
     try:
         if message in ["next", "prev"]:  # Check if the message is to scroll stocks
@@ -61,8 +133,7 @@ def process_message(message: str):
         elif message != "init_start":
             current_stock = message.upper()  # Convert the message to uppercase for the stock symbol
         if message != "start":
-            display.lcd_clear()
-            display.lcd_display_string(current_stock, 1)
+            show_precomputed(current_stock)
     except KeyboardInterrupt:  # Handle the KeyboardInterrupt to clean up
         print("Cleaning up!")
-        display.lcd_clear()  # Clear the LCD display
+        display.clear()  # Clear the LCD display
@@ -0,0 +1,169 @@
+import os  # For the optional endpoint's port
+import json  # For the endpoint responses
+import time  # For stage timings
+from collections import deque  # Ring buffer of finished traces
+from threading import Thread, Lock, local  # Traces follow a request across the worker threads
+
+TRACE_SAMPLES = 500  # Finished request traces kept in memory
+SLOWEST_SYMBOLS = 5  # Symbols listed in the summary's slowest section
+METRICS_HTTP_PORT = os.environ.get("METRICS_HTTP_PORT")  # Serve /stats on localhost when set
+
+
+# Timings of one request: stage durations in seconds, flags such as cache hits, and the queue wait
+class Trace:
+    __slots__ = ("command", "symbol", "submitted", "started", "stages", "flags")
+
+    def __init__(self, command: str, submitted: float):
+        self.command = command
+        self.symbol = None
+        self.submitted = submitted  # perf_counter time the command was queued
+        self.started = time.perf_counter()  # When a worker picked it up
+        self.stages = {}
+        self.flags = {}
+
+    def as_dict(self, finished: float) -> dict:
+        return {
+            "command": self.command,
+            "symbol": self.symbol,
+            "at": time.time(),
+            "queue_wait_ms": round((self.started - self.submitted) * 1000, 3),
+            "total_ms": round((finished - self.submitted) * 1000, 3),
+            "stages_ms": {stage: round(seconds * 1000, 3) for stage, seconds in self.stages.items()},
+            "flags": dict(self.flags),
+        }
+
+
+# Times a stage of the current thread's trace (does nothing when the thread is not tracing)
+class _Stage:
+    __slots__ = ("trace", "name", "started")
+
+    def __init__(self, trace, name: str):
+        self.trace = trace
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.trace is not None:
+            stages = self.trace.stages
+            stages[self.name] = stages.get(self.name, 0.0) + time.perf_counter() - self.started
+        return False
+
+
+# Per-request tracing into a ring buffer. The worker handling a request activates its trace, code on
+# the hot path then calls stage()/flag() without passing the trace around
+class Metrics:
+    def __init__(self, samples: int = TRACE_SAMPLES):
+        self._traces = deque(maxlen=samples)
+        self._lock = Lock()
+        self._local = local()
+
+    # Start tracing a command on this thread
+    def begin(self, command: str, submitted: float) -> Trace:
+        trace = Trace(command, submitted)
+        self.activate(trace)
+        return trace
+
+    # Continue a trace on this thread (e.g. on the scoring worker), None stops tracing on this thread
+    def activate(self, trace) -> None:
+        self._local.trace = trace
+
+    def current(self):
+        return getattr(self._local, "trace", None)
+
+    def stage(self, name: str) -> _Stage:
+        return _Stage(self.current(), name)
+
+    def flag(self, name: str, value=True) -> None:
+        trace = self.current()
+        if trace is not None:
+            trace.flags[name] = value
+
+    def set_symbol(self, symbol: str) -> None:
+        trace = self.current()
+        if trace is not None:
+            trace.symbol = symbol
+
+    # Store a finished trace in the ring buffer
+    def finish(self, trace: Trace) -> None:
+        record = trace.as_dict(time.perf_counter())
+        with self._lock:
+            self._traces.append(record)
+        if self.current() is trace:
+            self.activate(None)
+
+    # The most recent finished traces, newest last
+    def recent(self, limit: int = 20) -> list:
+        with self._lock:
+            return list(self._traces)[-limit:]
+
+    # Aggregates over the ring buffer: latency and per-stage percentiles, flag counts (how many traces set
+    # a flag true out of those that set it at all, e.g. cache hits) and the slowest symbols
+    def summary(self) -> dict:
+        with self._lock:
+            traces = list(self._traces)
+        stages, flags, per_symbol = {}, {}, {}
+        for trace in traces:
+            for stage, ms in trace["stages_ms"].items():
+                stages.setdefault(stage, []).append(ms)
+            for name, value in trace["flags"].items():
+                if isinstance(value, bool):
+                    flags.setdefault(name, []).append(value)
+            if trace["symbol"] and trace["stages_ms"]:
+                per_symbol.setdefault(trace["symbol"], []).append(trace["total_ms"])
+        slowest = sorted(per_symbol.items(), key=lambda item: -sum(item[1]) / len(item[1]))[:SLOWEST_SYMBOLS]
+        return {
+            "traces": len(traces),
+            "total_ms": _percentiles([trace["total_ms"] for trace in traces]),
+            "queue_wait_ms": _percentiles([trace["queue_wait_ms"] for trace in traces]),
+            "stages_ms": {stage: _percentiles(values) for stage, values in stages.items()},
+            "flags": {name: {"true": sum(values), "of": len(values)} for name, values in flags.items()},
+            "slowest_symbols": [{"symbol": symbol, "mean_ms": round(sum(totals) / len(totals), 3), "count": len(totals)}
+                                for symbol, totals in slowest],
+        }
+
+
+def _percentiles(values) -> dict:
+    if not values:
+        return {"count": 0, "p50": None, "p99": None, "max": None}
+    values = sorted(values)
+    pick = lambda q: values[min(len(values) - 1, int(q * len(values)))]
+    return {"count": len(values), "p50": pick(0.50), "p99": pick(0.99), "max": values[-1]}
+
+
+# Serve GET /stats (`summary()`, the recorder's summary by default) and /traces (recent traces) as JSON
+# on localhost, in a daemon thread
+def serve_http(port: int, summary=None, recorder: "Metrics" = None):
+    from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+    recorder = recorder or metrics
+    summary = summary or recorder.summary
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path == "/stats":
+                body = summary()
+            elif self.path == "/traces":
+                body = recorder.recent(TRACE_SAMPLES)
+            else:
+                self.send_error(404)
+                return
+            data = json.dumps(body).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass  # Keep the server output for commands
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+# Shared recorder used by the pipeline and the scoring path
+metrics = Metrics()
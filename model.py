@@ -1,78 +1,234 @@
 import os  # For interacting with the operating system
-import pandas as pd  # For data manipulation and analysis
+import time  # For training timestamps
 import numpy as np  # For numerical computations
-import matplotlib.pyplot as plt  # For plotting data
-from sklearn.preprocessing import MinMaxScaler  # For scaling features
-from keras.layers import LSTM, Dense  # For building LSTM model layers
-from sklearn.model_selection import TimeSeriesSplit  # For splitting time series data
-from keras.models import Sequential, load_model  # For creating and loading models
-import yfinance as yf  # For fetching financial data
+# pandas, keras and matplotlib are imported where they are used, so importing this
+# module (and starting the server) does not wait for the ML stack; see startup.preload
 
-from i2c_dev import Lcd  # Custom module for LCD control
+from display_service import display  # The single owner of the LCD
+from price_store import PriceStore, COLUMNS, bar_time, bar_timestamp  # Local on-disk price cache
+from feature_store import feature_store, fit_scaler, transform, scaler_key  # Scaled model inputs
+from folds import time_series_folds, fold_stability  # Arithmetic TimeSeriesSplit folds
+from scoring import score_one, score_batch  # Vectorized score and metrics
+from metrics import metrics  # Per-request stage timings
+from model_registry import registry  # Process-wide cache of loaded models
+from score_cache import score_cache, file_checksum  # Persistent cache of computed scores
+from numpy_lstm import artifact_path, from_keras  # TensorFlow-free inference artifacts
+from model_store import model_store  # Packed store of every model's weights
+from training_data import (windows, batches, steps, check_budget, peak_rss, reset_peak_rss,
+                           TRAIN_LOOKBACK)  # Memory-bounded training feed
 
-# Initialize the LCD display
-display = Lcd()
 
 # Define the Model class for stock prediction
 class Model:
-    def __init__(self, stock: str):
+    # Scoring parameters, part of the score cache fingerprint
+    score_params = {"n_splits": 10, "window": 30, "downtrend_penalty": 0.35}
+    epochs = 50  # Training epochs for a new model
+    fine_tune_epochs = 3  # Training epochs over the new bars when fine-tuning a saved model
+    lookback = TRAIN_LOOKBACK  # Timesteps per input window of a new model, saved models keep the one they were trained with
+
+    def __init__(self, stock: str, store: PriceStore = None):
         self.__stock = stock  # Store the stock symbol
-        self.df = None  # DataFrame to hold stock data
-        self.scaler = MinMaxScaler()  # Scaler for feature scaling
+        self.store = store or PriceStore()  # Price store, tops up from the network only when stale
+        self.rows = None  # Stored price rows of [timestamp, Open, High, Low, Close, Volume]
+        self._df = None  # DataFrame view of the rows, built on first use
+        self.scaler = None  # Min-max scaler parameters, saved with the model when it is trained
+        self.folds = None  # (train_end, test_start, test_end) of every fold, set when the data is split
+        self.stability = None  # Per-fold scores of the last walk-forward evaluation
+        self.metrics = None  # Score and error metrics of the last scoring
         self.lstm = None  # Variable to hold the LSTM model
+        self.peak_rss = None  # Peak RSS in bytes of the last training, saved with the model
         self.model_path = f"models/{stock}.keras"  # Path to store the model
+        self.lite_path = artifact_path(self.model_path)  # NumPy export of the model, used for inference when present
+
+    @property
+    def stock(self) -> str:
+        return self.__stock
+
+    # Check whether a trained model is saved for this stock (in the packed store or as a .keras file)
+    def has_model(self) -> bool:
+        return self.__stock in model_store or os.path.exists(self.model_path)
+
+    # What to load for inference, newest first: the packed store entry, then a NumPy export, then the
+    # .keras file. Packed entries are addressed as "<pack>#<symbol>@<checksum>" so an updated model
+    # gets a new registry key
+    def inference_path(self) -> str:
+        meta = model_store.metadata(self.__stock)
+        keras_time = os.path.getmtime(self.model_path) if os.path.exists(self.model_path) else None
+        if meta is not None and (keras_time is None or meta["trained_at"] >= keras_time):
+            return f"{model_store.path}#{self.__stock}@{meta['checksum']}"
+        if os.path.exists(self.lite_path) and (keras_time is None or os.path.getmtime(self.lite_path) >= keras_time):
+            return self.lite_path
+        return self.model_path
+
+    # Checksum identifying the model weights used for inference
+    def model_checksum(self) -> str:
+        path = self.inference_path()
+        if "#" in path:
+            return path.rsplit("@", 1)[1]
+        return file_checksum(path)
+
+    # Save the trained model: the .keras file (kept for retraining) and its entry in the packed store,
+    # each written to the side and swapped in so readers never see half a model. The metadata records
+    # the last bar the model was trained on (its watermark for fine-tuning), `meta` adds to it
+    def save_model(self, **meta) -> None:
+        directory, name = os.path.split(self.model_path)
+        tmp_path = os.path.join(directory, f".{os.getpid()}.{name}")
+        self.lstm.save(tmp_path)
+        os.replace(tmp_path, self.model_path)
+        train_end = self.folds[-1][0]
+        model_store.add(self.__stock, from_keras(self.lstm), trained_at=time.time(), scaler=self.scaler,
+                        lookback=self.lookback, peak_rss=self.peak_rss, first_bar=bar_time(self.rows[0, 0]), last_bar=bar_time(self.rows[-1, 0]),
+                        trained_through=bar_time(self.rows[train_end - 1, 0]), **meta)
+
+    # Scaler the model used for inference was trained with, None for models saved before scalers were kept
+    def saved_scaler(self):
+        if "#" not in self.inference_path():
+            return None
+        return model_store.metadata(self.__stock).get("scaler")
+
+    # Lookback the saved model was trained with (models saved before it was kept used one timestep)
+    def saved_lookback(self) -> int:
+        meta = model_store.metadata(self.__stock) if "#" in self.inference_path() else None
+        return (meta or {}).get("lookback", 1)
+
+    # Fingerprint of everything a score depends on: the latest bar (its date and values, which change
+    # while an intraday bar is still forming), the model file and the scoring parameters
+    def fingerprint(self) -> dict:
+        return {
+            "last_bar": bar_time(self.rows[-1, 0]),
+            "last_values": [float(value) for value in self.rows[-1, 1:]],
+            "model": self.model_checksum(),
+            "params": self.score_params,
+        }
 
-    # Fetch historical stock data using yfinance
+    # Fetch historical stock data from the local price store (topped up from yfinance when stale)
     def fetch_data(self):
-        self.df = yf.Ticker(self.__stock).history(period="10y")  # Fetch 10 years of data
-        self.df = pd.DataFrame(self.df)  # Convert to DataFrame
-        
-        if self.df.size == 0:
+        self.rows = self.store.get_array(self.__stock)  # 10 years of data, read from disk when possible
+        self._df = None
+
+        if self.rows is None or len(self.rows) == 0:
             raise ValueError(f"{self.__stock} Not Found!")  # Raise an error if no data is found
 
+    # The fetched data as a DataFrame, only built when asked for (e.g. for plotting)
+    @property
+    def df(self):
+        if self._df is None and self.rows is not None:
+            import pandas as pd
+
+            index = pd.Index(pd.to_datetime(self.rows[:, 0], unit="s"), name="Date")
+            self._df = pd.DataFrame(data=np.asarray(self.rows[:, 1:]), columns=COLUMNS, index=index)
+        return self._df
+
     # Plot the initial stock data
     def plot_initial_data(self):
+        import matplotlib.pyplot as plt  # For plotting data
+
         self.df['Close'].plot()  # Plot the closing prices
         plt.title("Initial Stock Data")
         plt.xlabel("Date")
         plt.ylabel("Close Price")
         plt.show()
 
-    # Scale the features for the LSTM model
+    # Scale the features for the LSTM model. A saved model is fed with the scaler it was trained with,
+    # and its scaled features are kept on disk so only newly added bars get scaled; otherwise (training,
+    # or a model saved without its scaler) the scaler is fitted on the fetched data. The model inputs
+    # are kept as one contiguous float32 array, the precision the LSTM computes in
     def scale_features(self):
-        features = ["Open", "High", "Low", "Volume"]  # Features to scale
-        feature_transform = self.scaler.fit_transform(self.df[features])  # Scale features
-        self.feature_transform = pd.DataFrame(columns=features, data=feature_transform, index=self.df.index)  # Create a DataFrame with the scaled features
-
-    # Split the data into training and testing sets using TimeSeriesSplit
-    def split_data(self):
-        timesplit = TimeSeriesSplit(n_splits=10)  # Define the number of splits
-        for train_index, test_index in timesplit.split(self.feature_transform):
-            X_train = self.feature_transform[:len(train_index)]  # Training features
-            X_test = self.feature_transform[len(train_index):(len(train_index)+len(test_index))]  # Testing features
-            y_train = self.df["Close"][:len(train_index)].values.ravel()  # Training target
-            y_test = self.df["Close"][len(train_index):(len(train_index)+len(test_index))].values.ravel()  # Testing target
+        saved = self.saved_scaler() if self.has_model() else None
+        if self.has_model():
+            self.lookback = self.saved_lookback()
+        if saved is not None:
+            self.scaler = saved
+            features = feature_store.get(self.__stock, self.rows, saved, key=scaler_key(saved))[:, 1:]
+        else:
+            self.scaler = fit_scaler(self.rows)
+            features = transform(self.rows, self.scaler)
+        self.feature_transform = np.ascontiguousarray(features, dtype=np.float32)
+
+    # Closing prices of the fetched rows
+    @property
+    def close(self):
+        return self.rows[:, COLUMNS.index("Close") + 1]
+
+    # Split the data into the last TimeSeriesSplit fold's training and testing sets (NumPy views, no
+    # copies). With walk_forward the test set spans the test windows of every fold, the last fold's
+    # window being its tail, so all folds can be predicted in one call. The test features start
+    # lookback - 1 rows early, so the first test row gets a full input window
+    def split_data(self, walk_forward: bool = False):
+        self.folds = time_series_folds(len(self.feature_transform), self.score_params["n_splits"])
+        train_end, test_start, test_end = self.folds[-1]
+        if walk_forward:
+            test_start = self.folds[0][1]
+        if test_start < self.lookback - 1:
+            raise ValueError(f"{self.__stock} has too little history for a lookback of {self.lookback}")
+        close = self.close
+        X_train = self.feature_transform[:train_end]  # Training features
+        X_test = self.feature_transform[test_start - self.lookback + 1:test_end]  # Testing features
+        y_train = close[:train_end]  # Training target
+        y_test = close[test_start:test_end]  # Testing target
         return X_train, X_test, y_train, y_test
 
-    # Prepare the data for the LSTM model
+    # Prepare the data for the LSTM model: windows of `lookback` rows, strided views of the features.
+    # The first lookback - 1 training targets have no window, training skips them (see training_data.batches)
     def prepare_data_for_lstm(self, X_train, X_test):
-        trainX = np.array(X_train)
-        testX = np.array(X_test)
-        X_train = trainX.reshape(X_train.shape[0], 1, trainX.shape[1])  # Reshape for LSTM
-        X_test = testX.reshape(X_test.shape[0], 1, testX.shape[1])  # Reshape for LSTM
-        return X_train, X_test
-
-    # Build and train the LSTM model
-    def build_and_train_lstm(self, X_train, y_train):
+        return windows(X_train, self.lookback), windows(X_test, self.lookback)
+
+    # Build and compile an untrained LSTM model for windows of `lookback` rows with `features` columns
+    def build_lstm(self, features: int):
+        from keras.layers import LSTM, Dense  # For building LSTM model layers
+        from keras.models import Sequential  # For creating models
+
         self.lstm = Sequential()  # Initialize the Sequential model
-        self.lstm.add(LSTM(32, input_shape=(1, X_train.shape[2]), activation='relu', return_sequences=False))  # Add LSTM layer
+        self.lstm.add(LSTM(32, input_shape=(self.lookback, features), activation='relu', return_sequences=False))  # Add LSTM layer
         self.lstm.add(Dense(1))  # Add output layer
         self.lstm.compile(loss='mean_squared_error', optimizer='adam')  # Compile the model
-        history = self.lstm.fit(X_train, y_train, epochs=50, batch_size=8, verbose=1, shuffle=False)  # Train the model
+        return self.lstm
+
+    # Train self.lstm batch by batch from the windows, stopping with MemoryError when the process goes over
+    # its memory budget, and keep the peak RSS of the training in self.peak_rss
+    def fit(self, X, y, epochs: int, callbacks=None, verbose: int = 1):
+        from keras.callbacks import LambdaCallback  # For the memory checks
+
+        budget = LambdaCallback(on_train_batch_end=lambda batch, logs: check_budget(batch))
+        reset_peak_rss()
+        history = self.lstm.fit(batches(X, y), steps_per_epoch=steps(X), epochs=epochs, verbose=verbose,
+                                shuffle=False, callbacks=[budget] + list(callbacks or []))
+        self.peak_rss = peak_rss()
+        print(f"{self.__stock}: peak RSS {self.peak_rss / 2**20:.0f} MiB while training")
         return history
 
+    # Build and train the LSTM model (callbacks are passed on to fit, e.g. for progress reporting)
+    def build_and_train_lstm(self, X_train, y_train, callbacks=None):
+        self.build_lstm(X_train.shape[2])
+        return self.fit(X_train, y_train, self.epochs, callbacks=callbacks)  # Train the model
+
+    # Continue training the packed model on the bars that entered the training window since it was last
+    # trained, with the scaler it was trained with, and save it with the new watermark. Bars past the
+    # training window stay unseen so the score remains out-of-sample. Models packed by the migration
+    # have no watermark, their training date stands in for it. Returns the number of bars trained on
+    def fine_tune(self, epochs: int = None, callbacks=None) -> int:
+        meta = model_store.metadata(self.__stock)
+        if meta is None or "#" not in self.inference_path():
+            raise ValueError(f"{self.__stock} has no packed model to fine-tune (see model_store.py migrate)")
+        if "trained_through" in meta:
+            watermark = bar_timestamp(meta["trained_through"])
+        else:
+            watermark = meta["trained_at"]
+        X_train, _, y_train, _ = self.prepare()
+        start = int(np.searchsorted(self.rows[:, 0], watermark, side="right"))
+        if start >= len(y_train):
+            return 0
+
+        self.build_lstm(X_train.shape[2]).set_weights(registry.get(self.inference_path()).get_weights())
+        self.fit(X_train[max(start - self.lookback + 1, 0):], y_train, epochs or self.fine_tune_epochs,
+                 callbacks=callbacks, verbose=0)  # Windows ending on the new bars
+        self.save_model(fine_tunes=meta.get("fine_tunes", 0) + 1)
+        return len(y_train) - start
+
     # Plot the true and predicted values
     def plot_predictions(self, y_pred, y_test):
+        import matplotlib.pyplot as plt  # For plotting data
+
         plt.plot(y_test, label='True Value')  # Plot true values
         plt.plot(y_pred, label='LSTM Value')  # Plot predicted values
         plt.title("Prediction by LSTM")
@@ -81,48 +237,77 @@ class Model:
         plt.legend()
         plt.show()
 
-    # Score the stock predictions
-    def score_stock(self, y_train, X_test, y_test):
-        y_pred = self.lstm.predict(X_test)  # Predict values using the LSTM model
+    # Score the stock predictions (y_pred can be passed in when predictions were made in a batch).
+    # Returns the score as a float, the other metrics are kept in self.metrics
+    def score_stock(self, y_train, X_test, y_test, y_pred=None) -> float:
+        if y_pred is None:
+            y_pred = self.lstm.predict(X_test)  # Predict values using the LSTM model
         # self.plot_predictions(y_pred, y_test)  # Optionally plot the predictions
 
-        earliest_actual = y_train[:30]  # First 30 actual values for comparison
-        latest_actual = y_test[-30:]  # Last 30 actual values
-        latest_pred = y_pred[-30:]  # Last 30 predicted values
-        
-        total_diff = 0
-        for i in range(30):
-            diff = abs((latest_pred[i] - latest_actual[i]) / latest_actual[i])  # Calculate absolute percentage difference
-            total_diff += diff
-        
-        avg_diff = total_diff / 30  # Calculate average difference
-        
-        if sum(earliest_actual) - sum(latest_actual) > 0:  # If there's a significant decrease, adjust the score
-            avg_diff += .35
-        
-        score = 100 - min(avg_diff * 100, 100)  # Calculate score
-        
-        print(f"Score: {score} / 100")  # Print the score
-        
-        return score
+        self.metrics = score_one(y_pred, y_test, y_train, window=self.score_params["window"],
+                                 downtrend_penalty=self.score_params["downtrend_penalty"])
+        print(f"Score: {self.metrics['score']} / 100")  # Print the score
+        return self.metrics["score"]
 
-    # Start the model training and evaluation process
-    def start(self):
-        self.fetch_data()  # Fetch the data
+    # Score every fold of a walk-forward split from predictions over its whole test span. The model is
+    # not retrained per fold, so earlier folds overlap its training data: the spread of the fold scores
+    # shows how stable the score is over time rather than out-of-sample accuracy
+    def fold_scores(self, y_pred) -> list:
+        close = self.close
+        offset = self.folds[-1][2] - len(y_pred)  # Row of the first prediction
+        metrics = score_batch([y_pred[test_start - offset:test_end - offset] for _, test_start, test_end in self.folds],
+                              [close[test_start:test_end] for _, test_start, test_end in self.folds],
+                              [close[:train_end] for train_end, _, _ in self.folds],
+                              window=self.score_params["window"], downtrend_penalty=self.score_params["downtrend_penalty"])
+        return metrics["score"].tolist()
+
+    # Turn the fetched data into LSTM-ready train and test sets
+    def prepare(self, walk_forward: bool = False):
         self.scale_features()  # Scale the features
-        X_train, X_test, y_train, y_test = self.split_data()  # Split the data
+        X_train, X_test, y_train, y_test = self.split_data(walk_forward)  # Split the data
         X_train, X_test = self.prepare_data_for_lstm(X_train, X_test)  # Prepare the data for LSTM
-        
-        if os.path.exists(self.model_path):  # Check if the model already exists
-            self.lstm = load_model(self.model_path)  # Load the existing model
+        return X_train, X_test, y_train, y_test
+
+    # Start the model training and evaluation process. walk_forward additionally scores every fold
+    # (stored in self.stability) and skips the score cache
+    def start(self, use_cache: bool = True, walk_forward: bool = False):
+        with metrics.stage("fetch"):
+            self.fetch_data()  # Fetch the data
+
+        if use_cache and not walk_forward and self.has_model():  # Nothing changed since the last run, reuse its score
+            cached = score_cache.get(self.__stock, self.fingerprint())
+            metrics.flag("score_cache_hit", cached is not None)
+            if cached is not None:
+                score_cache.touch(self.__stock)  # Checked against the latest data, fresh again
+                print(f"Score: {cached} / 100 (cached)")
+                return cached
+
+        with metrics.stage("preprocess"):
+            X_train, X_test, y_train, y_test = self.prepare(walk_forward)  # Scale, split and reshape the data
+
+        if self.has_model():  # Check if the model already exists
+            with metrics.stage("load"):
+                self.lstm = registry.get(self.inference_path())  # Load the existing model (or reuse the loaded one)
             print(f"{self.__stock}'s model loaded from the 'res' folder.")
         else:
-            display.lcd_clear()  # Clear the LCD display
-            display.lcd_display_string("Loading Model", 1)  # Display loading message
-            display.lcd_display_string(f"{self.__stock}", 2)  # Display stock symbol
+            from keras.callbacks import LambdaCallback  # For reporting training progress
 
-            self.build_and_train_lstm(X_train, y_train)  # Build and train the model
-            self.lstm.save(self.model_path)  # Save the trained model
+            display.show("Loading Model", self.__stock)  # Display loading message and stock symbol
+
+            progress = LambdaCallback(on_epoch_end=lambda epoch, logs: display.progress(f"Training {self.__stock}", epoch + 1, self.epochs))
+            self.build_and_train_lstm(X_train, y_train, callbacks=[progress])  # Build and train the model
+            self.save_model()  # Save the trained model
+            registry.put(self.inference_path(), model_store.load(self.__stock))  # Keep the packed copy loaded
             print(f"{self.__stock}'s model saved to the 'res' folder.")
 
-        return self.score_stock(y_train, X_test, y_test)  # Score the model and return the score
+        with metrics.stage("predict"):
+            y_pred = self.lstm.predict(X_test)  # One call, covering every fold when walking forward
+        with metrics.stage("score"):
+            if walk_forward:
+                scores = self.fold_scores(y_pred)
+                self.stability = fold_stability(scores)
+                score = scores[-1]
+            else:
+                score = self.score_stock(y_train, X_test, y_test, y_pred=y_pred)  # Score the model
+        score_cache.put(self.__stock, score, self.fingerprint())  # Remember it for next time
+        return score
@@ -0,0 +1,102 @@
+import os  # For reading the memory budget from the environment
+from collections import OrderedDict  # For keeping models in least-recently-used order
+from threading import Lock  # The registry is shared by the server and button threads
+
+from metrics import metrics  # Per-request cache hit flags
+
+# Default memory budget for loaded models, override with the MODEL_CACHE_BYTES environment variable
+DEFAULT_BUDGET_BYTES = int(os.environ.get("MODEL_CACHE_BYTES", 64 * 1024 * 1024))
+# Rough per-model cost of the Keras graph and layer objects on top of the raw weights
+MODEL_OVERHEAD_BYTES = 4 * 1024 * 1024
+
+
+# Estimate how much memory a loaded model holds
+def estimate_model_bytes(model) -> int:
+    weights = sum(w.nbytes for w in model.get_weights())
+    return weights + getattr(model, "overhead_bytes", MODEL_OVERHEAD_BYTES)
+
+
+# Load a model file: packed models ("<pack>#<symbol>@<checksum>") and NumPy artifacts (.npz) without
+# TensorFlow, anything else through keras
+def load_model_file(path: str):
+    if "#" in path:
+        from model_store import open_store
+        pack, entry = path.split("#", 1)
+        return open_store(pack).load(entry.split("@", 1)[0])
+    if path.endswith(".npz"):
+        from numpy_lstm import NumpyLSTM
+        return NumpyLSTM.load(path)
+    from keras.models import load_model  # Imported lazily so the registry itself stays light
+    return load_model(path)
+
+
+# Process-wide cache of loaded models, evicted in LRU order when over the memory budget
+class ModelRegistry:
+    def __init__(self, budget_bytes: int = DEFAULT_BUDGET_BYTES, loader=None):
+        self.budget_bytes = budget_bytes
+        self.loader = loader or load_model_file  # Function path -> model
+        self._models = OrderedDict()  # path -> (model, size in bytes)
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _load(self, path: str):
+        return self.loader(path)
+
+    # Return the model stored at `path`, loading it on a miss
+    def get(self, path: str):
+        with self._lock:
+            if path in self._models:
+                self._models.move_to_end(path)  # Mark as most recently used
+                self.hits += 1
+                metrics.flag("model_cache_hit")
+                return self._models[path][0]
+            self.misses += 1
+        metrics.flag("model_cache_hit", False)
+        model = self._load(path)  # Load outside the lock so other symbols are not blocked
+        self.put(path, model)
+        return model
+
+    # Add (or replace) a model, e.g. one that was just trained, and evict down to the budget
+    def put(self, path: str, model) -> None:
+        size = estimate_model_bytes(model)
+        with self._lock:
+            self._models[path] = (model, size)
+            self._models.move_to_end(path)
+            self._evict()
+
+    # Drop a model, e.g. when its file was replaced on disk
+    def discard(self, path: str) -> None:
+        with self._lock:
+            self._models.pop(path, None)
+
+    # Evict least recently used models until the total fits the budget (the newest model always stays)
+    def _evict(self) -> None:
+        total = sum(size for _, size in self._models.values())
+        while total > self.budget_bytes and len(self._models) > 1:
+            _, (_, size) = self._models.popitem(last=False)
+            total -= size
+            self.evictions += 1
+
+    # Load every existing model in `paths` ahead of time, skipping files that are missing
+    def prewarm(self, paths) -> None:
+        for path in paths:
+            if "#" in path or os.path.exists(path):
+                self.get(path)
+
+    # Counters for sizing the cache
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "models": len(self._models),
+                "bytes": sum(size for _, size in self._models.values()),
+                "budget_bytes": self.budget_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+# Shared registry used by Model
+registry = ModelRegistry()
@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+"""model_store.py
+
+Single packed file holding the weights of every model, memory-mapped and indexed by symbol.
+
+Usage: python3 model_store.py migrate [SYMBOL ...]   (pack existing models/*.keras files)
+       python3 model_store.py list
+
+"""
+
+import os  # For interacting with the operating system
+import json  # For the header
+import mmap  # For zero-copy access to the weights
+import time  # For metadata timestamps
+import glob  # For listing the .keras files to migrate
+import fcntl  # For serializing writers across processes
+import struct  # For the fixed-size part of the header
+import tempfile  # For unique temporary file names
+import hashlib  # For weight checksums
+import argparse  # For the command line interface
+from threading import Lock  # The store is shared by the server threads
+import numpy as np  # For the weight arrays
+
+from numpy_lstm import NumpyLSTM, from_keras  # TensorFlow-free models
+
+PACK_PATH = "models/models.pack"  # Default location of the packed store
+MAGIC = b"RSSPACK2"  # File signature, followed by the offset and length of the current index
+MAGIC_V1 = b"RSSPACK1"  # Packs written before appends were supported, still readable
+ALIGNMENT = 64  # Every array starts on a 64-byte boundary
+WEIGHT_NAMES = ["kernel", "recurrent_kernel", "bias", "dense_kernel", "dense_bias"]
+COMPACT_RATIO = 2  # The pack is rewritten once it is this many times larger than its live data
+
+# Layout: MAGIC | uint64 index offset | uint64 index length | arrays and indexes (each aligned to ALIGNMENT)
+# The index is JSON mapping each symbol to its arrays (offset in the file, shape, dtype), its activations
+# and a metadata dict (training date, data range, scaler parameters, checksum, ...). Adding models
+# appends their arrays and a new index and then points the fixed header at it, so one model costs its
+# own bytes plus the index instead of a rewrite of the whole pack. Replaced arrays and old indexes stay
+# behind as dead space (readers that parsed an older index can still use them) until the pack is
+# compacted. Version 1 packs (MAGIC_V1 | uint64 header length | header | arrays, with offsets relative
+# to the array region) are read as before and rewritten in this layout on the first write
+
+
+def _align(size: int) -> int:
+    return -(-size // ALIGNMENT) * ALIGNMENT
+
+
+# SHA-256 over a model's weight arrays, identifies the weights independently of where they are stored
+def weights_checksum(lstm: NumpyLSTM) -> str:
+    digest = hashlib.sha256()
+    for weight in lstm.get_weights():
+        digest.update(np.ascontiguousarray(weight, dtype=np.float32).tobytes())
+    return digest.hexdigest()
+
+
+# Memory-mapped store of many models in one file
+class ModelStore:
+    def __init__(self, path: str = PACK_PATH):
+        self.path = path
+        self._lock = Lock()
+        self._identity = None  # (inode, mtime, size) of the mapped file, to notice when it was replaced or appended to
+        self._mmap = None
+        self._index = {}
+        self._data_start = 0
+        self._version = None  # Layout version of the mapped pack
+
+    # Map the file (again, when a writer replaced it) and parse its header
+    def _refresh(self) -> None:
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            self._identity, self._mmap, self._index = None, None, {}
+            return
+        identity = (stat.st_ino, stat.st_mtime_ns, stat.st_size)  # Appends always grow the file
+        if identity == self._identity:
+            return
+        with open(self.path, "rb") as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if mapped[:len(MAGIC)] == MAGIC:
+            index_offset, index_length = struct.unpack_from("<QQ", mapped, len(MAGIC))
+            header, data_start = json.loads(bytes(mapped[index_offset:index_offset + index_length])), 0
+        elif mapped[:len(MAGIC_V1)] == MAGIC_V1:
+            (header_length,) = struct.unpack_from("<Q", mapped, len(MAGIC_V1))
+            header_start = len(MAGIC_V1) + 8
+            header = json.loads(bytes(mapped[header_start:header_start + header_length]))
+            data_start = _align(header_start + header_length)
+        else:
+            raise ValueError(f"{self.path} is not a model pack")
+        # Views handed out earlier keep the previous mapping alive, so it is simply dropped here
+        self._mmap, self._index = mapped, header["models"]
+        self._data_start = data_start
+        self._version = header.get("version", 1)
+        self._identity = identity
+
+    def symbols(self) -> list:
+        with self._lock:
+            self._refresh()
+            return sorted(self._index)
+
+    def __contains__(self, symbol: str) -> bool:
+        with self._lock:
+            self._refresh()
+            return symbol in self._index
+
+    def metadata(self, symbol: str):
+        with self._lock:
+            self._refresh()
+            entry = self._index.get(symbol)
+            return dict(entry["meta"]) if entry else None
+
+    # Model of a symbol whose weights are read-only views into the mapped file (no copies)
+    def load(self, symbol: str) -> NumpyLSTM:
+        with self._lock:
+            self._refresh()
+            entry = self._index[symbol]
+            weights = []
+            for name in WEIGHT_NAMES:
+                spec = entry["arrays"][name]
+                count = int(np.prod(spec["shape"]))
+                weight = np.frombuffer(self._mmap, dtype=spec["dtype"], count=count,
+                                       offset=self._data_start + spec["offset"])
+                weights.append(weight.reshape(spec["shape"]))
+        activation, recurrent_activation, dense_activation = entry["activations"]
+        return NumpyLSTM(*weights, activation=activation, recurrent_activation=recurrent_activation,
+                         dense_activation=dense_activation)
+
+    # Add or replace models, `models` maps symbol -> (NumpyLSTM, metadata dict). Their arrays and a new
+    # index are appended to the pack; a missing or version 1 pack, or one that is mostly dead space, is
+    # rewritten next to the old one and swapped in instead. Writers in other processes wait on a lock file
+    def write(self, models: dict) -> None:
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        models = {symbol: (lstm, dict(meta, checksum=weights_checksum(lstm))) for symbol, (lstm, meta) in models.items()}
+        with open(f"{self.path}.lock", "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            with self._lock:
+                self._refresh()
+                index, version = dict(self._index), self._version
+            if version == 2:
+                index = self._append(models, index)
+                live = sum(_align(int(np.prod(spec["shape"]))) * 4 for entry in index.values()
+                           for spec in entry["arrays"].values())
+                if os.path.getsize(self.path) <= COMPACT_RATIO * live + ALIGNMENT:
+                    return
+            entries = {symbol: (self.load(symbol), self.metadata(symbol)) for symbol in self.symbols()}
+            entries.update(models)
+            self._write_file(entries)
+
+    # Index entry of a model whose arrays are written at `offset`, with the arrays' bytes by offset
+    @staticmethod
+    def _layout(lstm: NumpyLSTM, meta: dict, offset: int):
+        arrays, blobs = {}, []
+        for name, weight in zip(WEIGHT_NAMES, lstm.get_weights()):
+            weight = np.ascontiguousarray(weight, dtype=np.float32)
+            arrays[name] = {"offset": offset, "shape": list(weight.shape), "dtype": "<f4"}
+            blobs.append((offset, weight.tobytes()))
+            offset = _align(offset + weight.nbytes)
+        entry = {"arrays": arrays, "meta": meta,
+                 "activations": [lstm.activation, lstm.recurrent_activation, lstm.dense_activation]}
+        return entry, blobs, offset
+
+    # Append models and the index that includes them, then point the header at the new index. Readers
+    # only ever see a complete index: the old one until the pointer changes, the new one after
+    def _append(self, models: dict, index: dict) -> dict:
+        with open(self.path, "r+b") as f:
+            offset = _align(f.seek(0, os.SEEK_END))
+            for symbol in sorted(models):
+                lstm, meta = models[symbol]
+                index[symbol], blobs, offset = self._layout(lstm, meta, offset)
+                for blob_offset, blob in blobs:
+                    f.seek(blob_offset)
+                    f.write(blob)
+            header = json.dumps({"version": 2, "models": index}, sort_keys=True).encode()
+            f.seek(offset)
+            f.write(header)
+            f.flush()
+            os.fsync(f.fileno())  # Arrays and index are on disk before the header points at them
+            f.seek(len(MAGIC))
+            f.write(struct.pack("<QQ", offset, len(header)))
+        return index
+
+    def _write_file(self, entries: dict) -> None:
+        index, blobs, offset = {}, [], _align(len(MAGIC) + 16)
+        for symbol in sorted(entries):
+            lstm, meta = entries[symbol]
+            index[symbol], entry_blobs, offset = self._layout(lstm, meta, offset)
+            blobs += entry_blobs
+        header = json.dumps({"version": 2, "models": index}, sort_keys=True).encode()
+
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(self.path) or ".", prefix=".pack.", suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(MAGIC + struct.pack("<QQ", offset, len(header)))
+            for blob_offset, blob in blobs:
+                f.seek(blob_offset)
+                f.write(blob)
+            f.seek(offset)
+            f.write(header)
+        os.replace(tmp_path, self.path)  # Atomic swap so readers never see half a file
+
+    # Add one model, e.g. right after it was trained
+    def add(self, symbol: str, lstm: NumpyLSTM, **meta) -> None:
+        self.write({symbol: (lstm, dict(meta, stored_at=time.time()))})
+
+
+# Pack existing .keras files into the store, recording their file dates as the training dates
+def migrate(store: ModelStore, keras_paths) -> list:
+    from keras.models import load_model  # Only the migration needs TensorFlow
+
+    models = {}
+    for path in keras_paths:
+        symbol = os.path.splitext(os.path.basename(path))[0]
+        try:
+            models[symbol] = (from_keras(load_model(path)),
+                              {"trained_at": os.path.getmtime(path), "source": os.path.basename(path),
+                               "stored_at": time.time()})
+        except ValueError as error:
+            print(f"Skipped {symbol}: {error}")  # Stays available through its .keras file
+    store.write(models)
+    return sorted(models)
+
+
+_stores = {}  # path -> ModelStore, so every user of a pack shares one mapping
+
+# The shared store for a pack file
+def open_store(path: str = PACK_PATH) -> ModelStore:
+    if path not in _stores:
+        _stores[path] = ModelStore(path)
+    return _stores[path]
+
+
+# Shared store used by Model
+model_store = open_store()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Packed model store.")
+    parser.add_argument("command", choices=["migrate", "list"])
+    parser.add_argument("symbols", nargs="*", help="symbols to migrate (default: every models/*.keras)")
+    parser.add_argument("--pack", default=PACK_PATH, help="path of the packed store")
+    args = parser.parse_args()
+
+    store = ModelStore(args.pack)
+    if args.command == "migrate":
+        paths = [f"models/{symbol.upper()}.keras" for symbol in args.symbols] or sorted(glob.glob("models/*.keras"))
+        print(f"Packed {len(migrate(store, paths))} models into {store.path}")
+    else:
+        for symbol in store.symbols():
+            print(symbol, json.dumps(store.metadata(symbol), sort_keys=True))
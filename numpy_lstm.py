@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""numpy_lstm.py
+
+Export saved Keras LSTMs to plain NumPy weight files and run them without TensorFlow.
+
+Usage: python3 numpy_lstm.py export [SYMBOL ...]
+       python3 numpy_lstm.py check [SYMBOL ...]
+Without symbols every model saved under models/ is exported or checked.
+
+"""
+
+import os  # For interacting with the operating system
+import sys  # For the exit status of the parity check
+import glob  # For listing the saved models
+import argparse  # For the command line interface
+import numpy as np  # For the forward pass
+
+PARITY_TOLERANCE = 1e-3  # Largest relative difference to the Keras output accepted by the parity check
+
+ACTIVATIONS = {
+    "relu": lambda x: np.maximum(x, 0),
+    "tanh": np.tanh,
+    "sigmoid": lambda x: 1 / (1 + np.exp(-x)),
+    "hard_sigmoid": lambda x: np.clip(0.2 * x + 0.5, 0, 1),
+    "linear": lambda x: x,
+}
+
+
+# Path of the NumPy artifact that goes with a .keras model
+def artifact_path(keras_path: str) -> str:
+    return os.path.splitext(keras_path)[0] + ".npz"
+
+
+# LSTM(units) followed by Dense(1), evaluated with NumPy only
+class NumpyLSTM:
+    overhead_bytes = 1024  # Tiny compared to a Keras model, used by the model registry
+
+    def __init__(self, kernel, recurrent_kernel, bias, dense_kernel, dense_bias,
+                 activation: str = "relu", recurrent_activation: str = "sigmoid", dense_activation: str = "linear"):
+        self.kernel = kernel  # (features, 4 * units), gates in Keras order: input, forget, cell, output
+        self.recurrent_kernel = recurrent_kernel  # (units, 4 * units)
+        self.bias = bias  # (4 * units,)
+        self.dense_kernel = dense_kernel  # (units, outputs)
+        self.dense_bias = dense_bias  # (outputs,)
+        self.activation = activation
+        self.recurrent_activation = recurrent_activation
+        self.dense_activation = dense_activation
+
+    @classmethod
+    def load(cls, path: str) -> "NumpyLSTM":
+        with np.load(path) as data:
+            arrays = {name: data[name] for name in data.files}
+        activations = [str(name) for name in arrays.pop("activations")]
+        return cls(**arrays, activation=activations[0], recurrent_activation=activations[1],
+                   dense_activation=activations[2])
+
+    def save(self, path: str) -> None:
+        tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+        np.savez(tmp_path, kernel=self.kernel, recurrent_kernel=self.recurrent_kernel, bias=self.bias,
+                 dense_kernel=self.dense_kernel, dense_bias=self.dense_bias,
+                 activations=np.array([self.activation, self.recurrent_activation, self.dense_activation]))
+        os.replace(tmp_path, path)  # Atomic swap so readers never see half a file
+
+    def get_weights(self):
+        return [self.kernel, self.recurrent_kernel, self.bias, self.dense_kernel, self.dense_bias]
+
+    # Forward pass over X of shape (samples, timesteps, features), returns (samples, outputs)
+    def predict(self, X, **kwargs):
+        return forward(np.asarray(X, dtype=np.float32)[None], self.kernel[None], self.recurrent_kernel[None],
+                       self.bias[None], self.dense_kernel[None], self.dense_bias[None],
+                       self.activation, self.recurrent_activation, self.dense_activation)[0]
+
+    predict_on_batch = predict  # Same call as Keras models for the batch scorer
+
+
+# Forward pass of S models with identical architecture at once: X is (S, samples, timesteps, features)
+# and every weight carries a leading S axis, so many symbols run as one array operation
+def forward(X, kernel, recurrent_kernel, bias, dense_kernel, dense_bias,
+            activation="relu", recurrent_activation="sigmoid", dense_activation="linear"):
+    act, rec_act = ACTIVATIONS[activation], ACTIVATIONS[recurrent_activation]
+    models, samples, timesteps, _ = X.shape
+    units = recurrent_kernel.shape[1]
+    h = np.zeros((models, samples, units), dtype=np.float32)
+    c = np.zeros((models, samples, units), dtype=np.float32)
+    for t in range(timesteps):
+        z = X[:, :, t, :] @ kernel + h @ recurrent_kernel + bias[:, None, :]
+        i = rec_act(z[..., :units])
+        f = rec_act(z[..., units:2 * units])
+        g = act(z[..., 2 * units:3 * units])
+        o = rec_act(z[..., 3 * units:])
+        c = f * c + i * g
+        h = o * act(c)
+    return ACTIVATIONS[dense_activation](h @ dense_kernel + dense_bias[:, None, :])
+
+
+# Run several NumpyLSTMs on their own inputs in a single stacked pass (inputs are padded to the longest)
+def predict_many(models, inputs):
+    first = models[0]
+    longest = max(len(X) for X in inputs)
+    X = np.zeros((len(inputs), longest) + inputs[0].shape[1:], dtype=np.float32)
+    for n, inputs_n in enumerate(inputs):
+        X[n, :len(inputs_n)] = inputs_n
+    stacked = [np.stack(weights) for weights in zip(*(model.get_weights() for model in models))]
+    outputs = forward(X, *stacked, first.activation, first.recurrent_activation, first.dense_activation)
+    return [outputs[n, :len(inputs_n)] for n, inputs_n in enumerate(inputs)]
+
+
+# Build a NumpyLSTM from a loaded Keras model, rejecting architectures the forward pass does not cover
+def from_keras(model) -> NumpyLSTM:
+    layers = model.layers
+    if [type(layer).__name__ for layer in layers] != ["LSTM", "Dense"]:
+        raise ValueError("Only LSTM followed by Dense models can be exported")
+    lstm, dense = layers[0].get_config(), layers[1].get_config()
+    if lstm.get("go_backwards") or lstm.get("return_sequences") or not lstm.get("use_bias", True) \
+            or not dense.get("use_bias", True):
+        raise ValueError("Unsupported LSTM configuration")
+    for name in (lstm["activation"], lstm["recurrent_activation"], dense["activation"]):
+        if name not in ACTIVATIONS:
+            raise ValueError(f"Unsupported activation {name}")
+    weights = [np.asarray(weight, dtype=np.float32) for weight in model.get_weights()]
+    return NumpyLSTM(*weights, activation=lstm["activation"], recurrent_activation=lstm["recurrent_activation"],
+                     dense_activation=dense["activation"])
+
+
+# Convert a .keras file into its NumPy artifact and return the artifact's path
+def export(keras_path: str, model=None) -> str:
+    if model is None:
+        from keras.models import load_model  # Only the export needs TensorFlow
+        model = load_model(keras_path)
+    path = artifact_path(keras_path)
+    from_keras(model).save(path)
+    return path
+
+
+# Largest relative difference between the Keras outputs and those of its NumPy versions on random
+# inputs: a fresh in-memory export, the .npz artifact and the packed store entry. Copies that were
+# never saved are reported as None
+def parity_errors(keras_path: str, samples: int = 256) -> dict:
+    from keras.models import load_model
+    from model_store import model_store  # Imported here, the store itself imports this module
+
+    model = load_model(keras_path)
+    X = np.random.default_rng(0).random((samples,) + tuple(model.input_shape[1:]), dtype=np.float32)
+    expected = model.predict_on_batch(X)
+    symbol = os.path.splitext(os.path.basename(keras_path))[0]
+    candidates = {
+        "export": from_keras(model),
+        "artifact": NumpyLSTM.load(artifact_path(keras_path)) if os.path.exists(artifact_path(keras_path)) else None,
+        "pack": model_store.load(symbol) if symbol in model_store else None,
+    }
+    errors = {}
+    for name, lstm in candidates.items():
+        errors[name] = None if lstm is None else \
+            float(np.max(np.abs(lstm.predict(X) - expected) / np.maximum(np.abs(expected), 1)))
+    return errors
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export Keras LSTMs to NumPy and check parity.")
+    parser.add_argument("command", choices=["export", "check"])
+    parser.add_argument("symbols", nargs="*", help="symbols to process (default: every saved model)")
+    args = parser.parse_args()
+
+    paths = [f"models/{symbol.upper()}.keras" for symbol in args.symbols] or sorted(glob.glob("models/*.keras"))
+    failed = 0
+    for path in paths:
+        if args.command == "export":
+            print(f"{path} -> {export(path)}")
+        else:
+            try:
+                errors = parity_errors(path)
+            except (OSError, ValueError) as error:  # Missing or unsupported model
+                failed += 1
+                print(f"{path}: FAILED ({error})")
+                continue
+            # Every copy must match, and inference needs at least one saved copy
+            ok = all(error is None or error <= PARITY_TOLERANCE for error in errors.values()) \
+                and (errors["artifact"] is not None or errors["pack"] is not None)
+            failed += not ok
+            report = ", ".join(f"{name} {'missing' if error is None else f'{error:.2e}'}" for name, error in errors.items())
+            print(f"{path}: max relative error {report} {'ok' if ok else 'FAILED'}")
+    sys.exit(1 if failed else 0)
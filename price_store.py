@@ -0,0 +1,204 @@
+import os  # For interacting with the operating system
+import json  # For reading and writing the manifest
+import fcntl  # For serializing manifest updates
+import tempfile  # For unique temporary file names
+import time  # For refresh timestamps
+from datetime import datetime, timedelta  # For converting stored timestamps to dates
+import numpy as np  # For the on-disk price arrays
+# pandas is imported where DataFrames are built, so loading the store stays cheap at startup
+
+# Columns kept in the store, in on-disk order (column 0 of each file is the bar date)
+COLUMNS = ["Open", "High", "Low", "Close", "Volume"]
+
+# Default directory for the price store and how long a symbol is trusted before topping it up
+PRICES_DIR = "prices"
+REFRESH_INTERVAL = 60 * 60  # Seconds between top-ups of the same symbol
+HISTORY_YEARS = 10  # Amount of history kept per symbol
+ADJUSTMENT_COLUMNS = ["Stock Splits", "Dividends"]  # Provider events that re-adjust the earlier prices
+ADJUSTMENT_TOLERANCE = 1e-4  # Relative change of a stored open that counts as a re-adjustment
+
+
+# Base class for price providers, the store asks a provider for rows it does not have yet
+class PriceProvider:
+    # Return a DataFrame of daily bars indexed by date, starting at `start` or covering `period` when start is None
+    def history(self, symbol: str, start=None, period: str = "10y") -> "pd.DataFrame":
+        raise NotImplementedError
+
+
+# Provider backed by yfinance (the default, needs network access)
+class YFinanceProvider(PriceProvider):
+    def history(self, symbol: str, start=None, period: str = "10y") -> "pd.DataFrame":
+        import pandas as pd
+        import yfinance as yf  # Imported here so offline providers never need it
+
+        ticker = yf.Ticker(symbol)
+        if start is None:
+            return pd.DataFrame(ticker.history(period=period))
+        return pd.DataFrame(ticker.history(start=start))
+
+
+# Provider reading `<directory>/<SYMBOL>.csv` files, a stand-in for yfinance in tests and offline runs
+class CsvProvider(PriceProvider):
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def history(self, symbol: str, start=None, period: str = "10y") -> "pd.DataFrame":
+        import pandas as pd
+
+        path = os.path.join(self.directory, f"{symbol}.csv")
+        if not os.path.exists(path):
+            return pd.DataFrame(columns=COLUMNS)  # Same as yfinance for an unknown symbol
+        df = pd.read_csv(path, index_col=0)
+        df.index = pd.to_datetime(df.index, utc=True)  # Handles both naive and offset-stamped dates
+        if start is not None:
+            df = df[df.index >= pd.Timestamp(start, tz="UTC")]
+        return df
+
+
+# Local on-disk price store: one NumPy file per symbol plus a JSON manifest
+class PriceStore:
+    def __init__(self, directory: str = PRICES_DIR, provider: PriceProvider = None,
+                 refresh_interval: float = REFRESH_INTERVAL):
+        self.directory = directory
+        self.provider = provider or YFinanceProvider()
+        self.refresh_interval = refresh_interval
+        self.manifest_path = os.path.join(directory, "manifest.json")
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, symbol: str) -> str:
+        return os.path.join(self.directory, f"{symbol}.npy")
+
+    # Read the manifest, an unreadable or missing manifest just means every symbol gets re-checked
+    def _read_manifest(self) -> dict:
+        try:
+            with open(self.manifest_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    # Update one manifest entry under a lock file, so concurrent writers (threads or processes) never
+    # drop each other's entries
+    def _write_manifest_entry(self, symbol: str, entry: dict) -> None:
+        with open(f"{self.manifest_path}.lock", "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            manifest = self._read_manifest()
+            manifest[symbol] = entry
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix=".manifest.", suffix=".tmp")
+            with os.fdopen(fd, "w") as f:
+                json.dump(manifest, f, indent=1, sort_keys=True)
+            os.replace(tmp_path, self.manifest_path)  # Atomic swap so readers never see half a file
+
+    # Load the stored rows of a symbol as a read-only memory-mapped array (None when not stored)
+    def load_array(self, symbol: str):
+        path = self._path(symbol)
+        if not os.path.exists(path):
+            return None
+        return np.load(path, mmap_mode="r")
+
+    # Persist rows atomically and record them in the manifest
+    def _save_array(self, symbol: str, rows: np.ndarray) -> None:
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix=f".{symbol}.", suffix=".tmp.npy")
+        with os.fdopen(fd, "wb") as f:  # A unique name, so concurrent writers never share a temp file
+            np.save(f, np.ascontiguousarray(rows, dtype=np.float64))
+        os.replace(tmp_path, self._path(symbol))
+        self._write_manifest_entry(symbol, {
+            "rows": int(len(rows)),
+            "first": _to_date(rows[0, 0]) if len(rows) else None,
+            "last": _to_date(rows[-1, 0]) if len(rows) else None,
+            "checked": time.time(),
+        })
+
+    # True when the symbol was topped up recently enough to be served from disk alone
+    def is_fresh(self, symbol: str) -> bool:
+        entry = self._read_manifest().get(symbol)
+        return bool(entry) and time.time() - entry.get("checked", 0) < self.refresh_interval
+
+    # Bring a symbol up to date, fetching only the bars from the last stored date onwards. Prices are
+    # split and dividend adjusted, so when the top-up shows a new adjustment the whole history is fetched again
+    def refresh(self, symbol: str):
+        stored = self.load_array(symbol)
+        if stored is None or len(stored) == 0:
+            rows = _frame_to_rows(self.provider.history(symbol, period=f"{HISTORY_YEARS}y"))
+        else:
+            last = _to_date(stored[-1, 0])
+            df = self.provider.history(symbol, start=last)
+            new_rows = _frame_to_rows(df)
+            if len(new_rows) and _readjusted(stored, df, new_rows):
+                print(f"{symbol}: prices were re-adjusted, fetching the whole history again")
+                rows = _frame_to_rows(self.provider.history(symbol, period=f"{HISTORY_YEARS}y"))
+            elif len(new_rows):
+                # The last stored bar may have been partial (fetched intraday), so new rows replace it
+                keep = np.asarray(stored[stored[:, 0] < new_rows[0, 0]])
+                rows = np.concatenate([keep, new_rows])
+            else:
+                rows = np.asarray(stored)
+            cutoff = time.time() - HISTORY_YEARS * 365.25 * 24 * 60 * 60
+            rows = rows[rows[:, 0] >= cutoff]  # Keep the same window a fresh fetch would return
+        if len(rows) == 0:
+            return rows
+        self._save_array(symbol, rows)
+        return self.load_array(symbol)
+
+    # Return the stored rows of a symbol, topping them up first when they are stale
+    def get_array(self, symbol: str):
+        stored = self.load_array(symbol)
+        if stored is not None and self.is_fresh(symbol):
+            return stored
+        try:
+            return self.refresh(symbol)
+        except Exception:
+            if stored is None:
+                raise
+            return stored  # Offline or provider failure, serve what is already on disk
+
+    # Return the price history of a symbol as a DataFrame indexed by date
+    def history(self, symbol: str) -> "pd.DataFrame":
+        import pandas as pd
+
+        rows = self.get_array(symbol)
+        index = pd.to_datetime(rows[:, 0], unit="s")
+        return pd.DataFrame(data=np.asarray(rows[:, 1:]), columns=COLUMNS, index=pd.Index(index, name="Date"))
+
+
+# Convert a provider DataFrame into float64 rows of [timestamp, Open, High, Low, Close, Volume]
+def _frame_to_rows(df: "pd.DataFrame") -> np.ndarray:
+    import pandas as pd
+
+    if df is None or df.size == 0:
+        return np.empty((0, len(COLUMNS) + 1))
+    index = pd.DatetimeIndex(df.index)
+    if index.tz is not None:
+        index = index.tz_localize(None)  # Daily bars, the exchange-local date is all that matters
+    dates = index.normalize().to_numpy().astype("datetime64[s]").astype(np.int64)  # Seconds since the epoch
+    rows = np.empty((len(df), len(COLUMNS) + 1))
+    rows[:, 0] = dates
+    rows[:, 1:] = df[COLUMNS].to_numpy(dtype=np.float64)
+    return rows
+
+
+# True when a top-up means the stored history has to be re-adjusted: a split or dividend after the
+# last stored bar (the provider adjusts every earlier price for it), or an overlapping bar whose open
+# no longer matches the stored one (providers without event columns, or an event that was missed)
+def _readjusted(stored, df: "pd.DataFrame", new_rows: np.ndarray) -> bool:
+    after = new_rows[:, 0] > stored[-1, 0]
+    for column in ADJUSTMENT_COLUMNS:
+        if column in df.columns and np.any(np.nan_to_num(df[column].to_numpy(dtype=np.float64))[after] != 0):
+            return True
+    positions = np.searchsorted(stored[:, 0], new_rows[:, 0])
+    overlap = (positions < len(stored)) & (stored[np.minimum(positions, len(stored) - 1), 0] == new_rows[:, 0])
+    opening = COLUMNS.index("Open") + 1
+    return not np.allclose(stored[positions[overlap], opening], new_rows[overlap, opening], rtol=ADJUSTMENT_TOLERANCE)
+
+
+def _to_date(timestamp: float) -> str:
+    return (datetime(1970, 1, 1) + timedelta(seconds=float(timestamp))).date().isoformat()
+
+
+# ISO date and time of a stored bar, as pandas formats the bar's index entry
+def bar_time(timestamp: float) -> str:
+    return (datetime(1970, 1, 1) + timedelta(seconds=float(timestamp))).isoformat()
+
+
+# Stored timestamp of a bar_time string
+def bar_timestamp(text: str) -> float:
+    return (datetime.fromisoformat(text) - datetime(1970, 1, 1)).total_seconds()
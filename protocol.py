@@ -0,0 +1,208 @@
+import json  # Frames are JSON objects, one per line
+import time  # For the queue wait of score jobs
+from queue import Queue, Full  # Score jobs of a connection
+from threading import Thread, Lock  # Replies come from the scoring thread and the training farm
+
+from metrics import metrics  # Per-request stage timings
+
+MAX_LINE = 4096  # Longest accepted frame in bytes
+MAX_PENDING = 256  # Score jobs a connection may have queued, enough for a large watchlist
+LCD_COMMANDS = ("next", "prev", "start", "refresh")
+ID_TYPES = (str, int, float, type(None))  # Request ids are scalars, they key the pending replies
+
+# Protocol: every frame is one line ending in "\n".
+# Requests are JSON objects with a client-chosen "id" and a "cmd":
+#   {"id": 1, "cmd": "score", "symbols": ["AAPL", "MSFT"]}  score symbols ("symbol" for a single one)
+#   {"id": 2, "cmd": "show", "symbol": "AAPL"}              select a stock on the LCD
+#   {"id": 3, "cmd": "next"}                                 LCD commands: next, prev, start, refresh
+#   {"id": 4, "cmd": "stats"}                                server metrics
+# Replies are JSON lines carrying the request's id and a "type":
+#   ack (LCD command queued), stats, training and progress (while a missing model trains),
+#   score (one per symbol, as soon as it is ready), error, and done (all symbols of a score request answered)
+# Lines that are not JSON are the original plain commands ("next", "AAPL", ...; a trailing "\r" is ignored)
+# and get no reply, except "stats" which is answered with the stats as a bare JSON line.
+
+
+# Splits a byte stream into lines, whatever way it was fragmented or batched
+class FrameReader:
+    def __init__(self, max_line: int = MAX_LINE):
+        self.max_line = max_line
+        self._buffer = b""
+
+    # Add received bytes, returns the complete lines (without "\n"); an overlong line raises ValueError
+    def feed(self, data: bytes) -> list:
+        self._buffer += data
+        *lines, self._buffer = self._buffer.split(b"\n")
+        if len(self._buffer) > self.max_line or any(len(line) > self.max_line for line in lines):
+            self._buffer = b""
+            raise ValueError(f"Frame longer than {self.max_line} bytes")
+        return [line.decode("utf-8", errors="replace") for line in lines]
+
+
+def encode(frame) -> bytes:
+    return (json.dumps(frame) + "\n").encode()
+
+
+# One client connection: reads pipelined requests and streams replies. LCD commands go through the
+# pipeline, score requests run on the connection's own thread so a long watchlist does not hold up
+# the buttons (and a slow client only delays its own results)
+class Session:
+    def __init__(self, sock, pipeline):
+        self.sock = sock
+        self.pipeline = pipeline
+        self._send_lock = Lock()
+        self._jobs = Queue(maxsize=MAX_PENDING)  # (request id, symbol, queued at), None stops the worker
+        self._remaining = {}  # request id -> symbols not answered yet
+        self._remaining_lock = Lock()  # Answers come from the score worker and the farm's callback thread
+        self._closed = False
+        self._worker = Thread(target=self._score_worker, daemon=True)
+
+    # Serve until the client disconnects
+    def serve(self) -> None:
+        reader = FrameReader()
+        self._worker.start()
+        try:
+            while True:
+                data = self.sock.recv(1024)
+                if not data:
+                    break
+                try:
+                    lines = reader.feed(data)
+                except ValueError as error:
+                    self.send({"id": None, "type": "error", "error": str(error)})
+                    continue
+                for line in lines:
+                    try:
+                        self.handle(line)
+                    except Exception as error:  # One bad frame must not drop the other pipelined requests
+                        self.send({"id": None, "type": "error", "error": f"Request failed: {error}"})
+        except OSError:
+            pass  # Connection dropped
+        finally:
+            self._closed = True
+            self._jobs.put(None)
+
+    def send(self, frame) -> None:
+        if self._closed:
+            return
+        data = encode(frame) if not isinstance(frame, bytes) else frame
+        try:
+            with self._send_lock:  # Replies from several threads must not interleave
+                while data:
+                    data = data[self.sock.send(data):]
+        except OSError:
+            self._closed = True
+
+    def handle(self, line: str) -> None:
+        line = line.rstrip("\r")
+        if not line.startswith("{"):
+            self._legacy(line)
+            return
+        try:
+            request = json.loads(line)
+            request_id, command = request.get("id"), request["cmd"]
+        except (ValueError, KeyError, AttributeError):
+            self.send({"id": None, "type": "error", "error": "Malformed request"})
+            return
+        if not isinstance(request_id, ID_TYPES) or isinstance(request_id, bool):
+            self.send({"id": None, "type": "error", "error": "id must be a string or a number"})
+            return
+
+        if command == "stats":
+            self.send({"id": request_id, "type": "stats", "stats": self.pipeline.stats()})
+        elif command == "score":
+            symbols = request["symbols"] if "symbols" in request else [request.get("symbol")]
+            if not isinstance(symbols, list) or not all(isinstance(symbol, str) for symbol in symbols):
+                self.send({"id": request_id, "type": "error", "error": "symbols must be a list of strings"})
+                return
+            self._queue_scores(request_id, symbols)
+        elif command in LCD_COMMANDS or command == "show":
+            symbol = request.get("symbol", "")
+            message = command if command != "show" else (symbol if isinstance(symbol, str) else "")
+            if message and self.pipeline.submit(message):
+                self.send({"id": request_id, "type": "ack"})
+            else:
+                self.send({"id": request_id, "type": "error", "error": "Busy" if message else "Missing symbol"})
+        else:
+            self.send({"id": request_id, "type": "error", "error": f"Unknown command {command!r}"})
+
+    # The original protocol: a bare command per line, no replies
+    def _legacy(self, message: str) -> None:
+        if not message:
+            return
+        if message == "stats":
+            self.send((json.dumps(self.pipeline.stats()) + "\n").encode())
+        else:
+            self.pipeline.submit(message)
+
+    def _queue_scores(self, request_id, symbols) -> None:
+        symbols = [symbol.upper() for symbol in symbols if symbol]
+        if not symbols:
+            self.send({"id": request_id, "type": "error", "error": "Missing symbol"})
+            return
+        with self._remaining_lock:
+            self._remaining[request_id] = self._remaining.get(request_id, 0) + len(symbols)
+        for symbol in symbols:
+            try:
+                self._jobs.put_nowait((request_id, symbol, time.perf_counter()))
+            except Full:
+                self._answer(request_id, {"type": "error", "symbol": symbol, "error": "Busy"})
+
+    # Send a final reply for one symbol of a request, followed by "done" after the last one
+    def _answer(self, request_id, frame: dict) -> None:
+        self.send({"id": request_id, **frame})
+        with self._remaining_lock:
+            self._remaining[request_id] -= 1
+            finished = self._remaining[request_id] == 0
+            if finished:
+                del self._remaining[request_id]
+        if finished:
+            self.send({"id": request_id, "type": "done"})
+
+    def _score_worker(self) -> None:
+        while True:
+            job = self._jobs.get()
+            if job is None or self._closed:
+                return
+            request_id, symbol, queued = job
+            trace = metrics.begin("score", queued)  # Traced like the LCD commands, so it shows in stats
+            metrics.set_symbol(symbol)
+            try:
+                self._score(request_id, symbol)
+            except Exception as error:
+                metrics.flag("failed")
+                self._answer(request_id, {"type": "error", "symbol": symbol, "error": str(error)})
+            finally:
+                metrics.finish(trace)
+
+    def _score(self, request_id, symbol: str) -> None:
+        from model import Model  # Imported on first use, like the rest of the model stack
+        from training_farm import farm
+
+        model = Model(symbol)
+        if not model.has_model():  # Train in the farm, streaming its progress, then score
+            try:
+                model.fetch_data()  # Unknown symbols fail here instead of after a worker started
+            except ValueError:
+                self._answer(request_id, {"type": "error", "symbol": symbol, "error": "Not found"})
+                return
+
+            def progress(symbol, epoch, epochs):
+                self.send({"id": request_id, "type": "progress", "symbol": symbol, "epoch": epoch, "epochs": epochs})
+
+            def done(symbol, error):
+                if error is not None:
+                    self._answer(request_id, {"type": "error", "symbol": symbol, "error": str(error)})
+                elif not self._closed:
+                    self._jobs.put((request_id, symbol, time.perf_counter()))  # Score it now that the model exists
+
+            farm.submit(symbol, on_done=done, on_progress=progress)
+            self.send({"id": request_id, "type": "training", "symbol": symbol})
+            return
+        try:
+            score = model.start()
+        except ValueError:
+            self._answer(request_id, {"type": "error", "symbol": symbol, "error": "Not found"})
+            return
+        self._answer(request_id, {"type": "score", "symbol": symbol, "score": score,
+                                  "last_bar": model.fingerprint()["last_bar"]})
@@ -0,0 +1,125 @@
+import os  # For interacting with the operating system
+import csv  # For reading the ranked table
+from datetime import datetime, timedelta  # For scheduling the nightly run
+from threading import Thread, Lock, Event  # The table is read by the command threads while the scheduler rewrites it
+
+from price_store import PriceStore, bar_time  # Latest stored bar of a symbol, for the stale marker
+from score_cache import MARKET_TZ, last_market_close  # The nightly run follows the exchange's day
+
+RANKINGS_PATH = "rankings.csv"  # Ranked table written by batch_score
+NIGHTLY_RUN = (20, 0)  # New York time of the nightly scoring run, after the close when the day's bars are final
+
+
+# Ranked scores of the whole catalogue, loaded from the batch_score table. Symbols are indexed by
+# position, so looking one up and stepping to its neighbours in score order are O(1)
+class RankingTable:
+    def __init__(self, path: str = RANKINGS_PATH, store: PriceStore = None):
+        self.path = path
+        self.store = store or PriceStore()
+        self._lock = Lock()
+        self._rows = []  # Rows in rank order: symbol, rank, score, last_bar, scored_at
+        self._index = {}  # symbol -> position in _rows
+        self._mtime = None
+
+    # Load the table again when the file changed (a missing file is an empty table)
+    def reload(self) -> None:
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        if mtime == self._mtime:
+            return
+        rows = []
+        if mtime is not None:
+            with open(self.path, newline="") as f:
+                for row in csv.DictReader(f):
+                    rows.append({"symbol": row["symbol"], "rank": int(row["rank"]), "score": float(row["score"]),
+                                 "last_bar": row["last_bar"], "scored_at": row["scored_at"]})
+        rows.sort(key=lambda row: row["rank"])
+        with self._lock:
+            self._rows = rows
+            self._index = {row["symbol"]: position for position, row in enumerate(rows)}
+            self._mtime = mtime
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    # Row of a symbol, None when it is not ranked
+    def get(self, symbol: str):
+        with self._lock:
+            position = self._index.get(symbol)
+            return None if position is None else self._rows[position]
+
+    # The row `offset` places below (positive) or above (negative) a symbol in score order, wrapping
+    # around; an unranked symbol steps onto the top (or, going up, the bottom) of the table
+    def step(self, symbol: str, offset: int):
+        with self._lock:
+            if not self._rows:
+                return None
+            position = self._index.get(symbol)
+            if position is None:
+                position = -1 if offset > 0 else 0
+            return self._rows[(position + offset) % len(self._rows)]
+
+    # True when a score was computed before the symbol's latest stored bar
+    def is_stale(self, symbol: str, last_bar: str) -> bool:
+        rows = self.store.load_array(symbol)
+        return rows is not None and len(rows) > 0 and bar_time(rows[-1, 0]) > last_bar
+
+
+# Scores the whole catalogue once a day after the close and reloads the table. When the table is
+# missing or older than the last close it is rebuilt at the next run time, weekend included, never
+# at startup: a run fetches the whole catalogue and loads its models, competing with the first requests
+class NightlyRanking:
+    def __init__(self, table: RankingTable, run_at=NIGHTLY_RUN):
+        self.table = table
+        self.run_at = run_at
+        self._stop = Event()
+        self._thread = None
+
+    # Next weekday run time after `now` (or the next run time on any day, for catching up)
+    def next_run(self, now: datetime = None, weekends: bool = False) -> datetime:
+        now = (now or datetime.now(MARKET_TZ)).astimezone(MARKET_TZ)
+        run = now.replace(hour=self.run_at[0], minute=self.run_at[1], second=0, microsecond=0)
+        if run <= now:
+            run += timedelta(days=1)
+        while run.weekday() >= 5 and not weekends:  # No new bars over the weekend
+            run += timedelta(days=1)
+        return run
+
+    # True when the table does not cover the last session yet
+    def is_due(self) -> bool:
+        try:
+            return os.path.getmtime(self.table.path) < last_market_close().timestamp()
+        except FileNotFoundError:
+            return True
+
+    def run_once(self) -> None:
+        from batch_score import score_many, catalogue_symbols  # Loads the model stack only when scoring
+
+        score_many(catalogue_symbols(), output=self.table.path)
+        self.table.reload()
+
+    def _run(self) -> None:
+        run = self.next_run(weekends=self.is_due())
+        while True:
+            wait = (run - datetime.now(MARKET_TZ)).total_seconds()
+            if self._stop.wait(max(wait, 0)):
+                return
+            try:
+                self.run_once()
+            except Exception as error:  # A failed night must not stop the next ones
+                print(f"Nightly ranking failed: {error}")
+            run = self.next_run()
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._thread = Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+
+# Shared table browsed with the buttons
+ranking_table = RankingTable()
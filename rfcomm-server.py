@@ -6,91 +6,96 @@ Simple server application that uses RFCOMM sockets.
 """
 
 # Import necessary modules
-from lcd_model import process_message, scroll_stocks  # Custom functions for processing and displaying messages on the LCD
+import startup  # Startup timing, imported first so its clock starts with the server
+from lcd_model import prewarm_models  # Loads the default stocks' models ahead of time
+from command_pipeline import pipeline  # Queues commands and runs scoring off the I/O threads
+from protocol import Session  # Framed requests and streamed replies
+import metrics  # Request tracing and the optional local endpoint
+from rankings import NightlyRanking, ranking_table  # Nightly scoring of the whole catalogue
 import bluetooth  # PyBluez library for Bluetooth communication
-import RPi.GPIO as GPIO
-from time import sleep
+from buttons import Buttons  # Edge-triggered button input
 from threading import Thread
 
-def buttons():
-	GPIO.setmode(GPIO.BCM)
-	prev, start, next = 17, 27, 22
-
-	GPIO.setup(prev, GPIO.IN, pull_up_down=GPIO.PUD_UP)
-	GPIO.setup(start, GPIO.IN, pull_up_down=GPIO.PUD_UP)
-	GPIO.setup(next, GPIO.IN, pull_up_down=GPIO.PUD_UP)
-	sleep(1)
-	try:
-		while True:
-			if not GPIO.input(prev):
-				process_message("prev")
-			elif not GPIO.input(start):
-				process_message("start")
-			elif not GPIO.input(next):
-				process_message("next")
-			sleep(.1)
-	except KeyboardInterrupt:
-		pass  # Handle keyboard interrupt (Ctrl+C) gracefully
-
-
-buttons_thread = Thread(target=buttons)
-buttons_thread.start()
-
-# Create a Bluetooth socket using RFCOMM protocol
-server_sock = bluetooth.BluetoothSocket(bluetooth.RFCOMM)
-
-# Bind the socket to any available port
-server_sock.bind(("", bluetooth.PORT_ANY))
-
-# Listen for incoming connections with a backlog of 1
-server_sock.listen(1)
-
-# Get the port number assigned to the socket
-port = server_sock.getsockname()[1]
-
-# Define a UUID for the Bluetooth service
-uuid = "94f39d29-7d6d-437d-973b-fba39e49d4ee"
-
-# Advertise the Bluetooth service with the given UUID and Serial Port Profile
-bluetooth.advertise_service(server_sock, "SampleServer", service_id=uuid,
-                            service_classes=[uuid, bluetooth.SERIAL_PORT_CLASS],
-                            profiles=[bluetooth.SERIAL_PORT_PROFILE],
-                            )
-
-# Print message to indicate the server is waiting for a connection
-print("Waiting for connection on RFCOMM channel", port)
-
-# Initialize the LCD display with a start message
-process_message('init_start')
-
-try:
-    # Main loop to handle incoming connections
-    while True:
-        # Accept an incoming connection
-        client_sock, client_info = server_sock.accept()
-        print("Accepted connection from", client_info)
-
-        try:
-            # Loop to receive data from the connected client
-            while True:
-                data = client_sock.recv(1024)  # Receive data (up to 1024 bytes) from the client
-                if not data:
-                    break  # If no data is received, break out of the loop
-                message = data.decode('utf-8')  # Decode the received data to a string
-                message = message.strip('\n')  # Remove any trailing newline characters
-                message = message[:-1]  # Remove the last character (assuming it's a delimiter)
-                process_message(message)  # Process the received message using a custom function
-        except OSError:
-            pass  # Ignore socket errors and continue
-
+# Handle one connected client, several clients can be connected at once
+def client(client_sock, client_info):
+    try:
+        # Newline-framed requests, several per packet or split across packets, answered on the same socket
+        Session(client_sock, pipeline).serve()
+    finally:
         print("Disconnected from", client_info)
         client_sock.close()  # Close the client socket
 
-except KeyboardInterrupt:
-    pass  # Handle keyboard interrupt (Ctrl+C) gracefully
 
-finally:
-    server_sock.close()  # Ensure the server socket is closed on exit
-    print("All done.")
+# Start the pipeline, buttons and Bluetooth service and serve clients until interrupted. Kept out of the
+# module level because training farm workers are spawned processes that import this script again
+def main():
+    startup.mark("server imports")
+    pipeline.start()
+
+    # Local metrics endpoint (curl http://127.0.0.1:$METRICS_HTTP_PORT/stats), off unless configured
+    if metrics.METRICS_HTTP_PORT:
+        metrics.serve_http(int(metrics.METRICS_HTTP_PORT), summary=pipeline.stats)
+
+    # Button presses go through the same pipeline as Bluetooth commands
+    buttons = Buttons(pipeline.submit)
+    buttons.start()
+    startup.mark("pipeline and buttons")
+
+    # Create a Bluetooth socket using RFCOMM protocol
+    server_sock = bluetooth.BluetoothSocket(bluetooth.RFCOMM)
+
+    # Bind the socket to any available port
+    server_sock.bind(("", bluetooth.PORT_ANY))
+
+    # Listen for incoming connections with a backlog of 4
+    server_sock.listen(4)
+
+    # Get the port number assigned to the socket
+    port = server_sock.getsockname()[1]
+
+    # Define a UUID for the Bluetooth service
+    uuid = "94f39d29-7d6d-437d-973b-fba39e49d4ee"
+
+    # Advertise the Bluetooth service with the given UUID and Serial Port Profile
+    bluetooth.advertise_service(server_sock, "SampleServer", service_id=uuid,
+                                service_classes=[uuid, bluetooth.SERIAL_PORT_CLASS],
+                                profiles=[bluetooth.SERIAL_PORT_PROFILE],
+                                )
+
+    # Print message to indicate the server is waiting for a connection
+    print("Waiting for connection on RFCOMM channel", port)
+    startup.mark("bluetooth advertised")
+
+    # Initialize the LCD display with a start message
+    pipeline.submit('init_start')
+
+    # Load the ML stack and the default stocks' models in the background, the first request that
+    # needs them before they are ready simply imports them itself
+    startup.preload_in_background(then=prewarm_models)
+
+    # Rank the whole catalogue every night so prev/next browse precomputed scores
+    ranking_table.reload()
+    nightly = NightlyRanking(ranking_table)
+    nightly.start()
+
+    try:
+        # Main loop to handle incoming connections
+        while True:
+            # Accept an incoming connection
+            client_sock, client_info = server_sock.accept()
+            print("Accepted connection from", client_info)
+            Thread(target=client, args=(client_sock, client_info), daemon=True).start()
+
+    except KeyboardInterrupt:
+        pass  # Handle keyboard interrupt (Ctrl+C) gracefully
+
+    finally:
+        server_sock.close()  # Ensure the server socket is closed on exit
+        print("Command latency:", pipeline.latency_percentiles())
+        buttons.stop()
+        nightly.stop()
+        print("All done.")
+
 
-buttons_thread.join()
+if __name__ == "__main__":
+    main()
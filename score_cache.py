@@ -0,0 +1,133 @@
+import os  # For interacting with the operating system
+import json  # For the on-disk cache file
+import time  # For cache timestamps
+import fcntl  # For serializing writers across processes
+import hashlib  # For model file checksums
+import tempfile  # For unique temporary file names
+from datetime import datetime, timedelta  # For market-hours arithmetic
+from zoneinfo import ZoneInfo  # Market hours are defined in New York time
+from threading import Lock  # The cache is shared by the server and background refreshes
+
+SCORES_PATH = "scores.json"  # Default location of the persistent cache
+
+# Regular trading session of the US exchanges
+MARKET_TZ = ZoneInfo("America/New_York")
+MARKET_OPEN = (9, 30)
+MARKET_CLOSE = (16, 0)
+INTRADAY_TTL = 15 * 60  # Seconds a score stays fresh while the market is open
+
+# Cache of model checksums keyed on (path, mtime, size) so unchanged files are hashed once
+_checksums = {}
+
+
+# SHA-256 of a model file, recomputed only when the file changes
+def file_checksum(path: str) -> str:
+    stat = os.stat(path)
+    key = (path, stat.st_mtime_ns, stat.st_size)
+    if key not in _checksums:
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 16), b""):
+                digest.update(chunk)
+        _checksums[key] = digest.hexdigest()
+    return _checksums[key]
+
+
+# True while the regular session is open
+def market_is_open(now: datetime = None) -> bool:
+    now = (now or datetime.now(MARKET_TZ)).astimezone(MARKET_TZ)
+    if now.weekday() >= 5:
+        return False
+    return MARKET_OPEN <= (now.hour, now.minute) < MARKET_CLOSE
+
+
+# Most recent session close at or before `now`
+def last_market_close(now: datetime = None) -> datetime:
+    now = (now or datetime.now(MARKET_TZ)).astimezone(MARKET_TZ)
+    close = now.replace(hour=MARKET_CLOSE[0], minute=MARKET_CLOSE[1], second=0, microsecond=0)
+    if close > now:
+        close -= timedelta(days=1)
+    while close.weekday() >= 5:  # Skip back over the weekend
+        close -= timedelta(days=1)
+    return close
+
+
+# Persistent cache of scores together with the fingerprint of the inputs that produced them
+class ScoreCache:
+    def __init__(self, path: str = SCORES_PATH):
+        self.path = path
+        self._lock = Lock()
+        self._entries = {}
+        self._mtime = None  # Modification time of the file the entries were read from
+
+    def _read(self) -> dict:
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _stat(self):
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    # Pick up entries written by other processes (e.g. a batch_score run) since the last read
+    def _refresh(self) -> None:
+        mtime = self._stat()
+        if mtime != self._mtime:
+            self._entries, self._mtime = self._read(), mtime
+
+    # Change one entry: under a lock file the cache is re-read, the entry updated and the file swapped
+    # in, so the server and a separate batch run never drop each other's scores
+    def _update(self, symbol: str, change) -> None:
+        directory = os.path.dirname(self.path) or "."
+        with self._lock, open(f"{self.path}.lock", "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            entries = self._read()
+            if change(entries) is False:
+                return
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".scores.", suffix=".tmp")
+            with os.fdopen(fd, "w") as f:
+                json.dump(entries, f, indent=1, sort_keys=True)
+            os.replace(tmp_path, self.path)  # Atomic swap so a crash never leaves half a file
+            self._entries, self._mtime = entries, self._stat()
+
+    # Latest entry for a symbol whatever its fingerprint, used to show something immediately
+    def lookup(self, symbol: str):
+        with self._lock:
+            self._refresh()
+            return self._entries.get(symbol)
+
+    # Cached score for a symbol, only if it was computed from exactly these inputs
+    def get(self, symbol: str, fingerprint: dict):
+        entry = self.lookup(symbol)
+        if entry is None or entry["fingerprint"] != fingerprint:
+            return None
+        return entry["score"]
+
+    # Store a freshly computed score
+    def put(self, symbol: str, score: float, fingerprint: dict) -> None:
+        entry = {"score": score, "fingerprint": fingerprint, "computed_at": time.time()}
+        self._update(symbol, lambda entries: entries.update({symbol: entry}))
+
+    # Mark a cached score as checked now: its inputs were found unchanged, so it is no longer stale
+    def touch(self, symbol: str) -> None:
+        def change(entries):
+            if symbol not in entries:
+                return False
+            entries[symbol]["computed_at"] = time.time()
+        self._update(symbol, change)
+
+    # True when an entry should be recomputed: older than the TTL during the session, or older than the last close
+    def is_stale(self, entry: dict, now: datetime = None) -> bool:
+        now = (now or datetime.now(MARKET_TZ)).astimezone(MARKET_TZ)
+        computed_at = entry["computed_at"]
+        if market_is_open(now):
+            return now.timestamp() - computed_at > INTRADAY_TTL
+        return computed_at < last_market_close(now).timestamp()
+
+
+# Shared cache used by Model and the LCD
+score_cache = ScoreCache()
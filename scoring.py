@@ -0,0 +1,45 @@
+import numpy as np  # For the vectorized metrics
+
+SCORE_WINDOW = 30  # Trading days compared at the end of the test set (and at the start of the training set)
+DOWNTREND_PENALTY = 0.35  # Added to the error when the window closed lower than the history started
+
+
+# Last `window` values of each series as one (series, window) matrix
+def _tails(series, window: int) -> np.ndarray:
+    tails = [np.ravel(values)[-window:] for values in series]
+    if any(len(tail) < window for tail in tails):
+        raise ValueError(f"Every series needs at least {window} values to be scored")
+    return np.array(tails, dtype=np.float64)
+
+
+# Score and metrics of many symbols (or folds) in one set of array operations. Each argument holds one
+# array per symbol: predictions, actual test prices and actual training prices. Returns arrays with one
+# entry per symbol:
+#   score                 100 minus the mean absolute percentage error in percent (never below 0), with
+#                         the downtrend penalty added to the error when the window ended below the start
+#   mape                  mean absolute percentage error over the window
+#   directional_accuracy  share of days on which the prediction moved the same way as the price
+#   drawdown              largest peak-to-trough fall of the actual price within the window
+def score_batch(y_preds, y_tests, y_trains, window: int = SCORE_WINDOW,
+                downtrend_penalty: float = DOWNTREND_PENALTY) -> dict:
+    pred = _tails(y_preds, window)
+    actual = _tails(y_tests, window)
+    earliest = np.array([np.ravel(values)[:window] for values in y_trains], dtype=np.float64)
+
+    mape = np.mean(np.abs((pred - actual) / actual), axis=1)
+    downtrend = earliest.sum(axis=1) - actual.sum(axis=1) > 0
+    score = 100 - np.minimum((mape + downtrend * downtrend_penalty) * 100, 100)
+
+    actual_move = np.sign(np.diff(actual, axis=1))
+    predicted_move = np.sign(pred[:, 1:] - actual[:, :-1])  # Predicted change from the previous close
+    directional_accuracy = np.mean(actual_move == predicted_move, axis=1)
+    drawdown = np.max(1 - actual / np.maximum.accumulate(actual, axis=1), axis=1)
+
+    return {"score": score, "mape": mape, "directional_accuracy": directional_accuracy, "drawdown": drawdown}
+
+
+# Score and metrics of a single symbol as plain floats
+def score_one(y_pred, y_test, y_train, window: int = SCORE_WINDOW,
+              downtrend_penalty: float = DOWNTREND_PENALTY) -> dict:
+    metrics = score_batch([y_pred], [y_test], [y_train], window, downtrend_penalty)
+    return {name: float(values[0]) for name, values in metrics.items()}
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""startup.py
+
+Startup timing and background preloading of the heavy ML stack.
+
+Run directly to print a startup-time breakdown as JSON:
+python3 startup.py
+
+"""
+
+import time  # For the startup clock
+import json  # For the report
+import importlib  # For importing the heavy modules by name
+from threading import Thread, Lock  # Preloading runs next to the server
+
+_started = time.perf_counter()  # Startup clock, starts when the server first imports this module
+_stages = []  # (stage, seconds since start, seconds the stage took)
+_lock = Lock()
+
+# Modules deferred out of the import path, in the order the preloader loads them. numpy is not one of
+# them: the model store and the NumPy model exports import it with the server modules, so its time is
+# part of "server imports". keras is left out as well: scoring runs on the NumPy exports, so TensorFlow
+# is only loaded when a model has to be trained
+HEAVY_MODULES = ["pandas", "yfinance"]
+
+
+# Record that a startup stage finished, `duration` defaults to the time since the previous stage
+def mark(stage: str, duration: float = None) -> None:
+    now = time.perf_counter() - _started
+    with _lock:
+        if duration is None:
+            duration = now - (_stages[-1][1] if _stages else 0.0)
+        _stages.append((stage, now, duration))
+
+
+# Import a module and record how long it took
+def timed_import(name: str):
+    started = time.perf_counter()
+    module = importlib.import_module(name)
+    mark(f"import {name}", time.perf_counter() - started)
+    return module
+
+
+# Import the heavy modules (skipping any that are missing), then run `then`, e.g. model pre-warming
+def preload(modules=HEAVY_MODULES, then=None) -> None:
+    for name in modules:
+        try:
+            timed_import(name)
+        except ImportError as error:
+            print(f"Preload skipped {name}: {error}")
+    if then is not None:
+        started = time.perf_counter()
+        then()
+        mark(getattr(then, "__name__", "then"), time.perf_counter() - started)
+    mark("preload done")
+    print(format_report())
+
+
+# Preload on a background thread so the server keeps starting up meanwhile
+def preload_in_background(modules=HEAVY_MODULES, then=None) -> Thread:
+    thread = Thread(target=preload, args=(modules, then), daemon=True)
+    thread.start()
+    return thread
+
+
+# The recorded stages as a list of dicts
+def report() -> list:
+    with _lock:
+        return [{"stage": stage, "at": round(at, 4), "took": round(took, 4)} for stage, at, took in _stages]
+
+
+# The recorded stages as a table
+def format_report() -> str:
+    lines = [f"{'stage':<34}{'at (s)':>9}{'took (s)':>10}"]
+    lines += [f"{row['stage']:<34}{row['at']:>9.3f}{row['took']:>10.3f}" for row in report()]
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    # Cold-start breakdown: the server-side modules first, then the deferred ML stack
+    for name in ["display_service", "buttons", "lcd_model", "command_pipeline"]:
+        timed_import(name)
+    mark("server modules")
+    for name in HEAVY_MODULES + ["keras"]:
+        try:
+            timed_import(name)
+        except ImportError as error:
+            print(f"Skipped {name}: {error}")
+    print(json.dumps(report(), indent=1))
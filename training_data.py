@@ -0,0 +1,90 @@
+import os  # For the memory budget setting and /proc
+import resource  # Peak memory where /proc is not available
+import numpy as np  # For the input windows
+
+TRAIN_BATCH_SIZE = 8
+TRAIN_LOOKBACK = int(os.environ.get("TRAIN_LOOKBACK", 1))  # Timesteps per input window of newly trained models
+SERVER_RESERVE = 768 * 2**20  # Memory left to the server, the OS and the page cache when training
+BUDGET_CHECK_BATCHES = 50  # Batches between two memory checks during training
+
+
+def total_memory() -> int:
+    return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+
+
+# Peak RSS a training job may reach before it is stopped: TRAIN_MEMORY_BUDGET_MB when set, otherwise
+# an equal share of the memory left after SERVER_RESERVE for each of `workers` concurrent jobs, so the
+# farm as a whole stays out of swap (about 780 MiB per worker with 4 workers on a 4 GB Pi)
+def memory_budget(workers: int = 1) -> int:
+    configured = os.environ.get("TRAIN_MEMORY_BUDGET_MB")
+    if configured:
+        return int(configured) * 2**20
+    return max(total_memory() - SERVER_RESERVE, 0) // max(workers, 1)
+
+
+# LSTM inputs of `lookback` consecutive rows, one window per row from the lookback-th on, shaped
+# (windows, lookback, features). A strided view of the rows, nothing is copied
+def windows(features: np.ndarray, lookback: int) -> np.ndarray:
+    if len(features) < lookback:
+        raise ValueError(f"{len(features)} rows are not enough for a lookback of {lookback}")
+    return np.lib.stride_tricks.sliding_window_view(features, lookback, axis=0).transpose(0, 2, 1)
+
+
+# Endless (inputs, targets) batches for keras fit, in order. Only one batch at a time is made
+# contiguous float32, the windows stay views of the rows. The targets are aligned with the windows
+# from the end: y may start with the rows before the first window ends (see Model.split_data)
+def batches(X, y, batch_size: int = TRAIN_BATCH_SIZE):
+    y = y[len(y) - len(X):]
+    while True:
+        for start in range(0, len(X), batch_size):
+            yield (np.ascontiguousarray(X[start:start + batch_size], dtype=np.float32),
+                   np.ascontiguousarray(y[start:start + batch_size], dtype=np.float32).reshape(-1, 1))
+
+
+# Batches per epoch of `batches`
+def steps(X, batch_size: int = TRAIN_BATCH_SIZE) -> int:
+    return -(-len(X) // batch_size)
+
+
+def _status(field: str):
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1]) * 1024  # Reported in kB
+    except OSError:
+        pass
+    return None
+
+
+# Resident memory of this process in bytes
+def current_rss() -> int:
+    rss = _status("VmRSS")
+    return rss if rss is not None else peak_rss()
+
+
+# Highest resident memory of this process since the last reset_peak_rss(), in bytes
+def peak_rss() -> int:
+    peak = _status("VmHWM")
+    return peak if peak is not None else resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024  # KiB on Linux
+
+
+# Start measuring the peak again from the current RSS, so a farm worker reports each job on its own
+# (Linux only; elsewhere the peak covers the whole process)
+def reset_peak_rss() -> None:
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+# Raise MemoryError when the process is over budget, checked every BUDGET_CHECK_BATCHES batches of training
+def check_budget(batch: int, budget: int = None) -> None:
+    if batch % BUDGET_CHECK_BATCHES != 0:
+        return
+    budget = budget or memory_budget()
+    if budget:
+        rss = current_rss()
+        if rss > budget:
+            raise MemoryError(f"Training stopped at {rss / 2**20:.0f} MiB, over the {budget / 2**20:.0f} MiB budget")
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""training_farm.py
+
+Train missing models in a pool of worker processes.
+
+Usage: python3 training_farm.py SYMBOL [SYMBOL ...] [--workers N] [--lookback N] [--memory-budget MIB]
+
+"""
+
+import os  # For interacting with the operating system
+import time  # For job timestamps
+import argparse  # For the command line interface
+import multiprocessing  # For the worker process context
+from concurrent.futures import ProcessPoolExecutor  # For the pool of training processes
+from concurrent.futures.process import BrokenProcessPool  # A worker died (e.g. killed when out of memory)
+from threading import Thread, Lock  # Job status is read from the server and button threads
+
+from model_registry import registry  # Process-wide cache of loaded models
+from numpy_lstm import artifact_path  # Path of a model's NumPy export
+from model_store import model_store  # Packed store of every model's weights
+from training_data import memory_budget  # Memory each training job may use
+
+TRAIN_WORKERS = 4  # One worker per core on the Pi 4
+THREADS_PER_WORKER = 1  # TensorFlow threads per worker, so the workers do not oversubscribe the cores
+
+
+_progress = None  # Queue for (symbol, epoch, epochs) reports, set in each worker
+
+# Runs once in every worker, before TensorFlow is imported there
+def _init_worker(threads: int, progress, budget: int) -> None:
+    global _progress
+    _progress = progress
+    os.environ["TRAIN_MEMORY_BUDGET_MB"] = str(budget // 2**20)  # This worker's share of the farm's memory
+    for name in ("OMP_NUM_THREADS", "TF_NUM_INTRAOP_THREADS", "TF_NUM_INTEROP_THREADS"):
+        os.environ[name] = str(threads)
+    import tensorflow as tf
+    tf.config.threading.set_intra_op_parallelism_threads(threads)
+    tf.config.threading.set_inter_op_parallelism_threads(threads)
+
+
+# Train and save the model of one symbol (runs inside a worker process)
+def train_symbol(symbol: str) -> str:
+    from model import Model  # Imported in the worker so TensorFlow loads after the thread limits are set
+    from keras.callbacks import LambdaCallback
+
+    model = Model(symbol)
+    model.fetch_data()  # Raises ValueError for unknown symbols
+    X_train, X_test, y_train, y_test = model.prepare()
+    callbacks = []
+    if _progress is not None:
+        callbacks.append(LambdaCallback(on_epoch_end=lambda epoch, logs: _progress.put((symbol, epoch + 1, model.epochs))))
+    model.build_and_train_lstm(X_train, y_train, callbacks=callbacks)
+    model.save_model()  # Written atomically, into models/ and the packed store
+    return model.model_path
+
+
+# Queue of training jobs backed by a process pool
+class TrainingFarm:
+    def __init__(self, workers: int = TRAIN_WORKERS, threads_per_worker: int = THREADS_PER_WORKER):
+        self.workers = workers
+        self.threads_per_worker = threads_per_worker
+        self._executor = None  # Started on the first job so idle servers do not keep 4 processes around
+        self._jobs = {}  # symbol -> job record
+        self._lock = Lock()
+
+    def _pool(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # "spawn" gives every worker a clean interpreter instead of a fork of a process that may hold TensorFlow
+            context = multiprocessing.get_context("spawn")
+            progress = context.SimpleQueue()
+            self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=context,
+                                                 initializer=_init_worker, initargs=(self.threads_per_worker, progress,
+                                                           memory_budget(self.workers)))
+            Thread(target=self._watch_progress, args=(progress,), daemon=True).start()
+        return self._executor
+
+    # Forward the epoch reports of the workers to the jobs' progress callbacks
+    def _watch_progress(self, progress) -> None:
+        while True:
+            symbol, epoch, epochs = progress.get()
+            with self._lock:
+                job = self._jobs.get(symbol)
+                if job is None:
+                    continue
+                job["epoch"], job["epochs"] = epoch, epochs
+                callbacks = list(job["progress_callbacks"])
+            for callback in callbacks:
+                callback(symbol, epoch, epochs)
+
+    # Queue a symbol for training, `on_done(symbol, error)` is called when it finishes (error is None on success)
+    # and `on_progress(symbol, epoch, epochs)` after every epoch. `task` is the picklable function run in the
+    # worker, it takes the symbol and returns the path of the saved model (e.g. fine_tune.fine_tune_symbol)
+    def submit(self, symbol: str, on_done=None, on_progress=None, task=train_symbol) -> dict:
+        with self._lock:
+            job = self._jobs.get(symbol)
+            if job is not None and job["state"] == "queued":  # Already queued or training, just add the callbacks
+                if on_done is not None:
+                    job["callbacks"].append(on_done)
+                if on_progress is not None:
+                    job["progress_callbacks"].append(on_progress)
+                return self.status(symbol)
+            job = {"state": "queued", "submitted": time.time(), "finished": None, "error": None,
+                   "epoch": 0, "epochs": None, "peak_rss": None,
+                   "callbacks": [on_done] if on_done is not None else [],
+                   "progress_callbacks": [on_progress] if on_progress is not None else []}
+            try:
+                pool = self._pool()
+                future = pool.submit(task, symbol)
+            except BrokenProcessPool:  # Broken since its last job finished, start a new pool once
+                self._discard_pool(pool)
+                pool = self._pool()
+                future = pool.submit(task, symbol)
+            job["future"], job["pool"] = future, pool
+            self._jobs[symbol] = job  # Only recorded once queued, a failed submit leaves no job behind
+        future.add_done_callback(lambda future: self._finish(symbol, future))
+        return self.status(symbol)
+
+    # Drop a broken pool so the next job starts a new one (call with the lock held)
+    def _discard_pool(self, pool) -> None:
+        if self._executor is pool:
+            self._executor = None
+            pool.shutdown(wait=False)
+
+    def _finish(self, symbol: str, future) -> None:
+        error = future.exception()
+        with self._lock:
+            job = self._jobs[symbol]
+            if isinstance(error, BrokenProcessPool):
+                self._discard_pool(job["pool"])
+            job["state"] = "failed" if error else "done"
+            job["error"] = error
+            job["finished"] = time.time()
+            if error is None:  # Peak RSS of the training, recorded with the saved model
+                job["peak_rss"] = (model_store.metadata(symbol) or {}).get("peak_rss")
+            callbacks = job["callbacks"]
+        if error is None:
+            registry.discard(future.result())  # Make sure nobody keeps using an older copy
+            registry.discard(artifact_path(future.result()))
+        for callback in callbacks:
+            callback(symbol, error)
+
+    # Status of one job, or of every job when no symbol is given
+    def status(self, symbol: str = None):
+        if symbol is None:
+            return {symbol: self.status(symbol) for symbol in list(self._jobs)}
+        job = self._jobs.get(symbol)
+        if job is None:
+            return None
+        state = job["state"]
+        if state == "queued" and job["future"].running():
+            state = "training"
+        return {"state": state, "submitted": job["submitted"], "finished": job["finished"],
+                "epoch": job["epoch"], "epochs": job["epochs"], "peak_rss": job["peak_rss"],
+                "error": str(job["error"]) if job["error"] else None}
+
+    # True while a symbol is queued or training
+    def is_busy(self, symbol: str) -> bool:
+        job = self._jobs.get(symbol)
+        return job is not None and job["state"] == "queued"
+
+    # Wait for the running jobs and stop the workers
+    def shutdown(self, wait: bool = True) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+            self._executor = None
+
+
+# Shared farm used by the request path
+farm = TrainingFarm()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train missing models in parallel.")
+    parser.add_argument("symbols", nargs="+", help="symbols to train")
+    parser.add_argument("--workers", type=int, default=TRAIN_WORKERS, help="number of worker processes")
+    parser.add_argument("--lookback", type=int, help="timesteps per input window (default: $TRAIN_LOOKBACK or 1)")
+    parser.add_argument("--memory-budget", type=int, help="MiB per training job (default: a share of the RAM)")
+    args = parser.parse_args()
+
+    # Passed on through the environment, the spawned workers read it when they import the model
+    if args.lookback:
+        os.environ["TRAIN_LOOKBACK"] = str(args.lookback)
+    if args.memory_budget:
+        os.environ["TRAIN_MEMORY_BUDGET_MB"] = str(args.memory_budget)
+
+    symbols = [symbol.upper() for symbol in args.symbols
+               if symbol.upper() not in model_store and not os.path.exists(f"models/{symbol.upper()}.keras")]
+    farm = TrainingFarm(workers=args.workers)
+    started = time.time()
+    for symbol in symbols:
+        farm.submit(symbol, on_done=lambda symbol, error: print(f"{symbol}: {error or 'trained'}"))
+    farm.shutdown(wait=True)
+    print(f"Trained {len(symbols)} symbols in {time.time() - started:.1f}s")